@@ -0,0 +1,156 @@
+import html
+import socketserver
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Tuple
+
+from fingerprint import fingerprint, find_matches
+
+
+class FakeMoss:
+    """
+    Local stand-in for Moss. It speaks the same socket protocol as moss.stanford.edu, so `mosspy.Moss` can send jobs
+    to it after pointing `Moss.server` and `Moss.port` here, and serves the reports over HTTP in the same format.
+    Similarity is computed with the local fingerprint engine.
+    """
+
+    def __init__(self, latency_secs: float = 0.0) -> None:
+        self.latency_secs = latency_secs
+        self.job_count = 0
+        self.file_count = 0
+        self._pages: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._http_server = ThreadingHTTPServer(("127.0.0.1", 0), self._get_http_handler_class())
+        self._http_server.daemon_threads = True
+        self._moss_server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self._get_moss_handler_class())
+        self._moss_server.daemon_threads = True
+
+    @property
+    def server(self) -> str:
+        return "127.0.0.1"
+
+    @property
+    def port(self) -> int:
+        return self._moss_server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._http_server.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._moss_server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        for server in (self._http_server, self._moss_server):
+            server.shutdown()
+            server.server_close()
+
+    def run_query(
+            self,
+            options: Dict[str, str],
+            base_files: List[Tuple[str, str]],
+            files: List[Tuple[str, str]],
+    ) -> str:
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+
+        with self._lock:
+            self.job_count += 1
+            self.file_count += len(files)
+            job_id = self.job_count
+        results_url = f"{self.url}/results/{job_id}"
+
+        language = options.get("language", "c")
+        base_hashes = set()
+        for display_name, source in base_files:
+            base_hashes.update(fingerprint(display_name, source, language).lines_by_hash)
+        fingerprints = []
+        source_by_display_name = dict(files)
+        for display_name, source in files:
+            file_fingerprints = fingerprint(display_name, source, language)
+            for base_hash in base_hashes & file_fingerprints.lines_by_hash.keys():
+                del file_fingerprints.lines_by_hash[base_hash]
+            fingerprints.append(file_fingerprints)
+
+        matches = sorted(
+            find_matches(fingerprints, 1, int(options.get("maxmatches", 10))),
+            key=lambda m: -max(m.similarity_percs),
+        )[:int(options.get("show", 250))]
+
+        rows = []
+        for idx, match in enumerate(matches):
+            match_url = f"{results_url}/match{idx}.html"
+            (name_1, name_2), (perc_1, perc_2) = match.file_paths, match.similarity_percs
+            rows.append(
+                f'<TR><TD><A HREF="{match_url}">{name_1} ({perc_1}%)</A>\n'
+                f'    <TD><A HREF="{match_url}">{name_2} ({perc_2}%)</A>\n'
+                f"<TD ALIGN=right>{len(match.matched_lines[0])}\n"
+            )
+            self._pages[f"/results/{job_id}/match{idx}.html"] = (
+                f'<HTML><HEAD><TITLE>Matches for {name_1} and {name_2}</TITLE></HEAD>'
+                f'<FRAMESET ROWS="50%,50%"><FRAME SRC="match{idx}-0.html" NAME="0">'
+                f'<FRAME SRC="match{idx}-1.html" NAME="1"></FRAMESET></HTML>\n'
+            )
+            for side, name in enumerate((name_1, name_2)):
+                self._pages[f"/results/{job_id}/match{idx}-{side}.html"] = (
+                    f"<HTML><BODY><PRE>{html.escape(source_by_display_name[name])}</PRE></BODY></HTML>\n"
+                )
+
+        self._pages[f"/results/{job_id}"] = (
+            "<HTML>\n<HEAD>\n<TITLE>Moss Results</TITLE>\n</HEAD>\n<BODY>\nMoss Results<p>\n"
+            f"Options -l {language} -m {options.get('maxmatches', 10)}\n<HR>\n<TABLE>\n"
+            "<TR><TH>File 1<TH>File 2<TH>Lines Matched\n"
+            + "".join(rows)
+            + "</TABLE>\n<HR>\nAny errors encountered during this query are listed below.<p></BODY>\n</HTML>\n"
+        )
+        return results_url
+
+    def _get_moss_handler_class(self):
+        fake = self
+
+        class MossHandler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                options: Dict[str, str] = {}
+                base_files: List[Tuple[str, str]] = []
+                files: List[Tuple[str, str]] = []
+                while True:
+                    line = self.rfile.readline().decode()
+                    if not line or line.startswith("end"):
+                        return
+                    command, _, argument = line.rstrip("\n").partition(" ")
+                    if command == "file":
+                        file_id, _, size, display_name = argument.split(" ", 3)
+                        source = self.rfile.read(int(size)).decode(errors="replace")
+                        (base_files if file_id == "0" else files).append((display_name, source))
+                    elif command == "query":
+                        url = fake.run_query(options, base_files, files)
+                        self.wfile.write(f"{url}\n".encode())
+                    else:
+                        options[command] = argument
+                        if command == "language":
+                            self.wfile.write(b"yes\n")
+
+        return MossHandler
+
+    def _get_http_handler_class(self):
+        fake = self
+
+        class HttpHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                page = fake._pages.get(self.path.rstrip("/"))
+                if page is None:
+                    self.send_error(404)
+                    return
+                data = page.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return HttpHandler
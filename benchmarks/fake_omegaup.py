@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any
+
+from benchmarks.synthetic_contest import SyntheticContest, SyntheticRun
+
+
+class FakeOmegaUp:
+    """
+    Local stand-in for the omegaUp API that serves a synthetic contest to `omegaup.api.Client`, with an optional
+    latency per request to mimic the network.
+    """
+
+    def __init__(self, contest: SyntheticContest, latency_secs: float = 0.0) -> None:
+        self.contest = contest
+        self.latency_secs = latency_secs
+        self.request_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # omegaUp lists the newest runs first
+        self._runs_by_problem: Dict[str, List[SyntheticRun]] = {}
+        for run in sorted(contest.runs, key=lambda r: -r.time):
+            self._runs_by_problem.setdefault(run.problem_alias, []).append(run)
+        self._run_by_guid = {run.guid: run for run in contest.runs}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._get_handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, endpoint: str, payload: Dict[str, str]) -> Any:
+        with self._lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+
+        if endpoint == "/api/user/login/":
+            return {"auth_token": "fake-token"}
+        if endpoint == "/api/contest/problems/":
+            return {"problems": [self._get_problem(idx, alias) for idx, alias in enumerate(self.contest.problem_aliases)]}
+        if endpoint == "/api/contest/scoreboard/":
+            return self._get_scoreboard()
+        if endpoint == "/api/contest/runs/":
+            runs = self._runs_by_problem.get(payload["problem_alias"], [])
+            offset = int(payload.get("offset", 0))
+            rowcount = int(payload.get("rowcount", 100))
+            return {
+                "runs": [self._get_run(run) for run in runs[offset:offset + rowcount]],
+                "totalRuns": len(runs),
+            }
+        if endpoint == "/api/run/source/":
+            return {"source": self._run_by_guid[payload["run_alias"]].source}
+        raise KeyError(endpoint)
+
+    def _get_handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+                try:
+                    status, body = 200, fake.handle(urllib.parse.urlparse(self.path).path, payload)
+                except KeyError as e:
+                    status, body = 404, {"status": "error", "error": f"Not found: {e}"}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+    @staticmethod
+    def _get_problem(idx: int, alias: str) -> Dict[str, Any]:
+        return {
+            "accepted": 0, "accepts_submissions": True, "alias": alias, "commit": "", "difficulty": 0.0,
+            "has_submissions": True, "input_limit": 10240, "is_extra_problem": False, "languages": "", "order": idx,
+            "points": 100.0, "quality_seal": False, "submissions": 0, "title": alias, "version": "", "visibility": 2,
+            "versions": {"log": [], "published": ""}, "visits": 0,
+        }
+
+    @staticmethod
+    def _get_run(run: SyntheticRun) -> Dict[str, Any]:
+        return {
+            "alias": run.problem_alias, "classname": "user-rank-unranked", "country": "MX", "guid": run.guid,
+            "language": run.language, "memory": 0, "penalty": 0, "runtime": 0, "score": run.score, "status": "ready",
+            "submit_delay": 0, "time": run.time, "username": run.username, "verdict": run.verdict,
+        }
+
+    def _get_scoreboard(self) -> Dict[str, Any]:
+        points_by_username: Dict[str, Dict[str, float]] = {}
+        for run in self.contest.runs:
+            problem_points = points_by_username.setdefault(run.username, {})
+            problem_points[run.problem_alias] = max(problem_points.get(run.problem_alias, 0.0), run.score * 100)
+
+        ranking = []
+        for username, name in self.contest.name_by_username.items():
+            problem_points = points_by_username.get(username, {})
+            ranking.append({
+                "classname": "user-rank-unranked", "country": "MX", "is_invited": True, "username": username,
+                "name": name, "total": {"penalty": 0.0, "points": sum(problem_points.values())},
+                "problems": [
+                    {
+                        "alias": alias, "penalty": 0.0, "percent": problem_points.get(alias, 0.0),
+                        "points": problem_points.get(alias, 0.0), "runs": 0,
+                    }
+                    for alias in self.contest.problem_aliases
+                ],
+            })
+        return {
+            "problems": [{"alias": alias, "order": idx} for idx, alias in enumerate(self.contest.problem_aliases)],
+            "ranking": sorted(ranking, key=lambda r: -r["total"]["points"]),
+            "start_time": 0,
+            "time": 0,
+            "title": self.contest.alias,
+        }
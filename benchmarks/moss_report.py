@@ -0,0 +1,85 @@
+"""
+Benchmarks the Moss report parser with synthetic reports shaped like the ones in test_files/.
+
+Run it from the root of the repository:
+    python -m benchmarks.moss_report --rows 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+from cpc_types import MossHtml
+from plagiarism import parse_moss_report
+
+_HEADER = """<HTML>
+<HEAD>
+<TITLE>Moss Results</TITLE>
+</HEAD>
+<BODY>
+Moss Results<p>
+Sat Jan 22 14:39:05 PST 2022
+<p>
+Options -l cc -m 10
+<HR>
+<TABLE>
+<TR><TH>File 1<TH>File 2<TH>Lines Matched
+"""
+
+_FOOTER = """</TABLE>
+<HR>
+Any errors encountered during this query are listed below.<p></BODY>
+</HTML>
+"""
+
+
+def write_synthetic_report(file_path: str, problem_alias: str, rows: int, same_user_ratio: float) -> None:
+    users = [f"user{idx}" for idx in range(max(rows // 4, 2))]
+    with open(file_path, "w") as f:
+        f.write(_HEADER)
+        for idx in range(rows):
+            user_1 = random.choice(users)
+            user_2 = user_1 if random.random() < same_user_ratio else random.choice(users)
+            perc_1, perc_2 = random.randint(1, 99), random.randint(1, 99)
+            url = f"http://moss.stanford.edu/results/9/5462386106114/match{idx}.html"
+            f.write(
+                f'<TR><TD><A HREF="{url}">generated/{problem_alias}/{user_1}/{idx}a_{user_1}_{problem_alias}_AC_100.cpp ({perc_1}%)</A>\n'
+                f'    <TD><A HREF="{url}">generated/{problem_alias}/{user_2}/{idx}b_{user_2}_{problem_alias}_WA_0.cpp ({perc_2}%)</A>\n'
+                f"<TD ALIGN=right>{random.randint(5, 200)}\n"
+            )
+        f.write(_FOOTER)
+
+
+def _benchmark(rows_list: List[int], same_user_ratio: float) -> None:
+    problem_alias = "Synthetic-Problem"
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            os.makedirs("submission")
+            print(f"{'Rows':>10} {'Matches':>10} {'Seconds':>10} {'Rows/s':>12} {'Peak MiB':>10}")
+            for rows in rows_list:
+                report_path = os.path.join("submission", f"{problem_alias}_cc_unfiltered_report.html")
+                write_synthetic_report(report_path, problem_alias, rows, same_user_ratio)
+                moss_html = MossHtml(problem_alias=problem_alias, language="cc", html_path=report_path)
+
+                tracemalloc.start()
+                start = time.perf_counter()
+                matches = sum(1 for _ in parse_moss_report(moss_html, {}))
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{rows:>10} {matches:>10} {elapsed:>10.3f} {rows / elapsed:>12.0f} {peak / 2 ** 20:>10.2f}")
+        finally:
+            os.chdir(previous_cwd)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Moss report parser with synthetic reports")
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000, 10000, 50000], help="Matches per report")
+    parser.add_argument("--same-user-ratio", type=float, default=0.3, help="Ratio of matches of a user with itself")
+    args = parser.parse_args()
+    _benchmark(args.rows, args.same_user_ratio)
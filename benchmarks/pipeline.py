@@ -0,0 +1,128 @@
+"""
+Times every stage of the check on a synthetic contest, served by local stand-ins of omegaUp and Moss, so performance
+changes can be measured without touching the real services.
+
+Run it from the root of the repository:
+    python -m benchmarks.pipeline --teams 300 --problems 10 --runs-per-team-problem 3 --latency-ms 20
+"""
+import argparse
+import os
+import tempfile
+
+import mosspy
+import omegaup.api
+
+import main
+from benchmarks.fake_moss import FakeMoss
+from benchmarks.fake_omegaup import FakeOmegaUp
+from benchmarks.synthetic_contest import generate_contest
+from client import PooledClient
+from heuristics import COLLUSION_WINDOW_MINUTES
+from plagiarism import MOSS_MAX_FILES_PER_JOB
+from tracing import TRACER
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    contest = generate_contest(
+        teams=args.teams,
+        problems=args.problems,
+        runs_per_team_problem=args.runs_per_team_problem,
+        languages=args.languages,
+        copy_ratio=args.copy_ratio,
+        seed=args.seed,
+    )
+    fake_omegaup = FakeOmegaUp(contest, latency_secs=args.latency_ms / 1000)
+    fake_moss = FakeMoss(latency_secs=args.moss_latency_ms / 1000)
+    fake_omegaup.start()
+    fake_moss.start()
+    mosspy.Moss.server = fake_moss.server
+    mosspy.Moss.port = fake_moss.port
+
+    TRACER.enable()
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            with TRACER.stage("total"):
+                _run_stages(args, contest.alias, fake_omegaup.url)
+        finally:
+            os.chdir(previous_cwd)
+            fake_omegaup.stop()
+            fake_moss.stop()
+
+    print(f"\n{len(contest.runs)} runs, {sum(fake_omegaup.request_counts.values())} omegaUp requests, "
+          f"{fake_moss.job_count} Moss jobs with {fake_moss.file_count} files")
+
+
+def _run_stages(args: argparse.Namespace, contest_alias: str, omegaup_url: str) -> None:
+    # The real check, so the benchmark always measures what main runs
+    client_class = PooledClient(
+        username="benchmark",
+        password="benchmark",
+        url=omegaup_url,
+        pool_size=max(args.download_workers, args.list_workers),
+    )
+    main._run_check(
+        omegaup.api.Contest(client=client_class),
+        omegaup.api.Run(client=client_class),
+        "benchmark",
+        [contest_alias],
+        "all",
+        ".",
+        should_check_plagiarism=True,
+        min_plagiarism_perc=args.min_plagiarism_perc,
+        check_diff_schools=False,
+        download_workers=args.download_workers,
+        list_workers=args.list_workers,
+        runs_page_size=args.runs_page_size,
+        plagiarism_engine=args.engine,
+        moss_workers=args.moss_workers,
+        use_moss_cache=False,
+        moss_max_files=args.moss_max_files,
+        incremental=False,
+        max_runs_per_user=args.max_runs_per_user,
+        heuristic_workers=args.heuristic_workers,
+        pipeline=args.pipeline,
+        streaming=args.streaming,
+        check_history=args.history,
+        compress_sources=True,
+        report_format="html",
+        archive_moss_workers=0,
+        collusion_window_minutes=COLLUSION_WINDOW_MINUTES,
+        top_teams=args.top_teams,
+        min_problem_points=None,
+        include_nearby_teams=False,
+        resume=False,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the whole check on a synthetic contest")
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--problems", type=int, default=5)
+    parser.add_argument("--runs-per-team-problem", type=int, default=3)
+    parser.add_argument("--languages", nargs="+", default=["cpp17-gcc", "c11-gcc", "java", "py3"])
+    parser.add_argument("--copy-ratio", type=float, default=0.1, help="Ratio of teams that copy another solution")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Latency of each omegaUp request")
+    parser.add_argument("--moss-latency-ms", type=float, default=1000, help="Latency of each Moss job")
+    parser.add_argument("--engine", choices=["moss", "local"], default="moss")
+    parser.add_argument("--min-plagiarism-perc", type=int, default=80)
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--list-workers", type=int, default=4)
+    parser.add_argument("--runs-page-size", type=int, default=100)
+    parser.add_argument("--heuristic-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--moss-workers", type=int, default=4)
+    parser.add_argument("--moss-max-files", type=int, default=MOSS_MAX_FILES_PER_JOB)
+    parser.add_argument("--max-runs-per-user", type=int)
+    parser.add_argument("--top-teams", type=int, help="Only check the runs of the top teams by total points")
+    parser.add_argument("--pipeline", action="store_true", help="Compare each problem as soon as it's downloaded")
+    parser.add_argument("--streaming", action="store_true", help="List and check the problems one at a time")
+    parser.add_argument("--history", action="store_true", help="Also compare with the index of past contests")
+    parser.add_argument("--trace", help="Also save the whole trace to this JSON file")
+    args = parser.parse_args()
+
+    run_benchmark(args)
+    TRACER.print_summary()
+    if args.trace:
+        TRACER.write_json(args.trace)
@@ -0,0 +1,148 @@
+import random
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+LANGUAGE_TEMPLATES = {
+    "cpp17-gcc": (
+        "#include <bits/stdc++.h>\nusing namespace std;\nint main() {{\n    long long n, {vars};\n    cin >> n;\n{body}"
+        "    cout << {result} << endl;\n    return 0;\n}}\n"
+    ),
+    "c11-gcc": (
+        "#include <stdio.h>\nint main() {{\n    long long n, {vars};\n    scanf(\"%lld\", &n);\n{body}"
+        "    printf(\"%lld\\n\", {result});\n    return 0;\n}}\n"
+    ),
+    "java": (
+        "import java.util.*;\npublic class Main {{\n    public static void main(String[] args) {{\n"
+        "        Scanner in = new Scanner(System.in);\n        long n = in.nextLong(), {vars};\n{body}"
+        "        System.out.println({result});\n    }}\n}}\n"
+    ),
+    "py3": "n = int(input())\n{vars_py}\n{body}print({result})\n",
+}
+
+
+@dataclass(frozen=True)
+class SyntheticRun:
+    guid: str
+    username: str
+    problem_alias: str
+    language: str
+    verdict: str
+    score: float
+    time: int
+    source: str
+
+
+@dataclass(frozen=True)
+class SyntheticContest:
+    alias: str
+    problem_aliases: List[str]
+    name_by_username: Dict[str, Optional[str]]
+    runs: List[SyntheticRun]
+
+
+def _random_statement(rng: random.Random, variables: List[str], language: str) -> str:
+    a, b, c = rng.sample(variables, 3)
+    op = rng.choice(["+", "-", "*", "%", "^"]) if language != "py3" else rng.choice(["+", "-", "*", "%"])
+    constant = rng.randint(1, 97)
+    kind = rng.randint(0, 3)
+    if language == "py3":
+        if kind == 0:
+            return f"for i in range(n):\n    {a} += ({b} {op} i) % {constant}\n"
+        if kind == 1:
+            return f"if {a} > {b}:\n    {c} = {a} {op} {constant}\n"
+        if kind == 2:
+            return f"while {a} > {constant}:\n    {a} //= 2\n"
+        return f"{a} = {b} {op} {c} + {constant}\n"
+
+    indent = "        " if language == "java" else "    "
+    if kind == 0:
+        return f"{indent}for (int i = 0; i < n; i++) {{ {a} += ({b} {op} i) % {constant}; }}\n"
+    if kind == 1:
+        return f"{indent}if ({a} > {b}) {{ {c} = {a} {op} {constant}; }}\n"
+    if kind == 2:
+        return f"{indent}while ({a} > {constant}) {{ {a} /= 2; }}\n"
+    return f"{indent}{a} = {b} {op} {c} + {constant};\n"
+
+
+def generate_source(rng: random.Random, language: str, statements: int) -> str:
+    variables = [f"{rng.choice('abcdefghpqrstxyz')}{idx}" for idx in range(6)]
+    body = "".join(_random_statement(rng, variables, language) for _ in range(statements))
+    return LANGUAGE_TEMPLATES[language].format(
+        vars=", ".join(f"{v} = {rng.randint(0, 9)}" for v in variables),
+        vars_py="\n".join(f"{v} = {rng.randint(0, 9)}" for v in variables),
+        body=body,
+        result=" + ".join(variables[:3]),
+    )
+
+
+def _disguise_copy(rng: random.Random, source: str, language: str) -> str:
+    """
+    Renames the variables and adds some comments, like a team trying to hide a copied solution.
+    """
+    source = re.sub(r"\b([a-z])(\d)\b", r"\1x\2", source)
+    comment = "#" if language == "py3" else "//"
+    lines = source.split("\n")
+    for _ in range(rng.randint(0, 5)):
+        position = rng.randint(1, len(lines) - 1)
+        lines.insert(position, f"{comment} Paso {rng.randint(1, 9)}: calculamos la respuesta")
+    return "\n".join(lines)
+
+
+def generate_contest(
+        teams: int,
+        problems: int,
+        runs_per_team_problem: int,
+        languages: List[str],
+        copy_ratio: float,
+        statements: int = 20,
+        seed: int = 0,
+) -> SyntheticContest:
+    """
+    Generates a contest where every team submits a few runs to every problem. A `copy_ratio` of the teams copy the
+    latest solution of another team for each problem instead of writing their own.
+    """
+    rng = random.Random(seed)
+    problem_aliases = [f"Problem-{idx}" for idx in range(problems)]
+    usernames = [f"team{idx}" for idx in range(teams)]
+    schools = [f"School{idx}" for idx in range(max(teams // 3, 1))]
+    name_by_username = {username: f"Team {idx}-{rng.choice(schools)}" for idx, username in enumerate(usernames)}
+
+    runs = []
+    contest_start = 1_700_000_000
+    for problem_alias in problem_aliases:
+        latest_source_by_username: Dict[str, SyntheticRun] = {}
+        for username in usernames:
+            language = rng.choice(languages)
+            submit_time = contest_start + rng.randint(0, 4 * 60 * 60)
+            originals = list(latest_source_by_username.values())
+            copies = bool(originals) and rng.random() < copy_ratio
+            for run_idx in range(runs_per_team_problem):
+                if copies:
+                    original = rng.choice(originals)
+                    language = original.language
+                    source = _disguise_copy(rng, original.source, language)
+                else:
+                    source = generate_source(rng, language, statements)
+                is_last = run_idx == runs_per_team_problem - 1
+                verdict = "AC" if is_last and rng.random() < 0.7 else rng.choice(["WA", "TLE", "PA"])
+                run = SyntheticRun(
+                    guid=f"{rng.getrandbits(64):016x}",
+                    username=username,
+                    problem_alias=problem_alias,
+                    language=language,
+                    verdict=verdict,
+                    score=1.0 if verdict == "AC" else round(rng.random(), 2) if verdict == "PA" else 0.0,
+                    time=submit_time,
+                    source=source,
+                )
+                runs.append(run)
+                latest_source_by_username[username] = run
+                submit_time += rng.randint(60, 30 * 60)
+
+    return SyntheticContest(
+        alias="synthetic-contest",
+        problem_aliases=problem_aliases,
+        name_by_username=name_by_username,
+        runs=runs,
+    )
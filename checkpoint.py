@@ -0,0 +1,74 @@
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import urllib.parse
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from cpc_types import RunRecord, SuspiciousActivity
+
+CHECKPOINTS_DIR = os.path.join("cache", "checkpoints")
+
+
+class Checkpoint:
+    """
+    Durable results of every finished unit of work of a check: the scoreboard, the runs of each problem, the
+    suspicious activities of each problem and the plagiarisms of each plagiarism job. The downloaded sources are
+    already kept by the source store. Each check with the same contests, problems and options has its own checkpoint,
+    which a resumed check reads to skip the units that were finished before it was interrupted.
+    """
+
+    def __init__(self, key: Any, resume: bool, checkpoints_dir: str = CHECKPOINTS_DIR) -> None:
+        key_hash = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+        self.checkpoint_dir = os.path.join(checkpoints_dir, key_hash)
+        if not resume and os.path.isdir(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    def get(self, unit: str) -> Optional[Any]:
+        unit_path = self._get_unit_path(unit)
+        if not os.path.exists(unit_path):
+            return None
+        with open(unit_path) as f:
+            return json.load(f)
+
+    def save(self, unit: str, data: Any) -> None:
+        # Write to a temporary file first so an interrupted check never leaves a truncated unit behind
+        unit_path = self._get_unit_path(unit)
+        tmp_path = f"{unit_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, unit_path)
+
+    def get_runs(self, unit: str) -> Optional[Dict[str, List[RunRecord]]]:
+        runs = self.get(unit)
+        if runs is None:
+            return None
+        return {
+            username: [
+                RunRecord(guid, username, language, verdict, score, datetime.fromtimestamp(timestamp))
+                for guid, language, verdict, score, timestamp in user_runs
+            ]
+            for username, user_runs in runs.items()
+        }
+
+    def save_runs(self, unit: str, runs_by_username: Dict[str, List[RunRecord]]) -> None:
+        self.save(unit, {
+            username: [[run.guid, run.language, run.verdict, run.score, run.time.timestamp()] for run in user_runs]
+            for username, user_runs in runs_by_username.items()
+        })
+
+    def get_activities(self, unit: str) -> Optional[List[SuspiciousActivity]]:
+        activities = self.get(unit)
+        return [SuspiciousActivity(**activity) for activity in activities] if activities is not None else None
+
+    def save_activities(self, unit: str, activities: List[SuspiciousActivity]) -> None:
+        self.save(unit, [dataclasses.asdict(activity) for activity in activities])
+
+    def clear(self) -> None:
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def _get_unit_path(self, unit: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{urllib.parse.quote(unit, safe='')}.json")
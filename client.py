@@ -0,0 +1,137 @@
+import datetime
+import threading
+import time
+import urllib.parse
+from typing import Optional, Mapping, BinaryIO
+
+import omegaup.api
+import requests
+from requests.adapters import HTTPAdapter
+
+from terminal import with_color, BColor
+from tracing import TRACER
+from util import with_retries
+
+# Statuses that usually mean the server is overloaded or restarting, so it makes sense to ask again
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# omegaUp answers with this status once the session of the auth token expires
+UNAUTHORIZED_STATUS_CODE = 401
+LOGIN_ENDPOINT = "/api/user/login/"
+
+
+class RetryableResponseError(Exception):
+    pass
+
+
+class PooledClient(omegaup.api.Client):
+    """
+    omegaUp client that shares a single pooled HTTP session across threads and retries transient failures with
+    exponential backoff, instead of opening a fresh connection for each query like `omegaup.api.Client` does. When
+    it logged in with a password and the session expires, it logs in again and repeats the request, so a long
+    running service keeps working.
+    """
+
+    def __init__(
+            self,
+            *,
+            pool_size: int = 10,
+            tries: int = 4,
+            backoff_secs: float = 1.0,
+            **kwargs,
+    ) -> None:
+        self.tries = tries
+        self.backoff_secs = backoff_secs
+        self._password = kwargs.get("password")
+        self._login_lock = threading.Lock()
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+        # The parent constructor logs in through `query`, so the session has to exist before calling it
+        super().__init__(**kwargs)
+
+    def query(
+            self,
+            endpoint: str,
+            payload: Optional[Mapping[str, str]] = None,
+            files_: Optional[Mapping[str, BinaryIO]] = None,
+            timeout_: datetime.timedelta = omegaup.api._DEFAULT_TIMEOUT,
+            check_: bool = True,
+    ) -> omegaup.api.ApiReturnType:
+        auth_token = self.auth_token
+        r = self._post(endpoint, payload, files_, timeout_)
+        if r.status_code == UNAUTHORIZED_STATUS_CODE and self._can_login_again(endpoint):
+            self._login_again(auth_token)
+            r = self._post(endpoint, payload, files_, timeout_)
+        response = r.json()
+        if check_ and r.status_code != 200:
+            raise Exception(response)
+        return response
+
+    def _can_login_again(self, endpoint: str) -> bool:
+        return self.api_token is None and self._password is not None and endpoint != LOGIN_ENDPOINT
+
+    def _login_again(self, expired_auth_token: Optional[str]) -> None:
+        with self._login_lock:
+            # The requests that failed at the same time only log in once
+            if self.auth_token != expired_auth_token:
+                return
+            print(with_color("\nThe omegaUp session expired, logging in again...", BColor.WARNING))
+            self.auth_token = self.query(
+                LOGIN_ENDPOINT, payload={"usernameOrEmail": self.username, "password": self._password}
+            )["auth_token"]
+
+    def _post(
+            self,
+            endpoint: str,
+            payload: Optional[Mapping[str, str]],
+            files_: Optional[Mapping[str, BinaryIO]],
+            timeout_: datetime.timedelta,
+    ) -> requests.Response:
+        payload = dict(payload) if payload else {}
+        headers = {}
+        if self.api_token is not None:
+            if self.username is not None:
+                headers["Authorization"] = f"Credential={self.api_token},Username={self.username}"
+            else:
+                headers["Authorization"] = f"token {self.api_token}"
+        elif self.auth_token is not None:
+            payload["ouat"] = self.auth_token
+
+        def post() -> requests.Response:
+            response = self._http.post(
+                urllib.parse.urljoin(self._url, endpoint),
+                data=payload,
+                headers=headers,
+                files=files_,
+                timeout=timeout_.total_seconds(),
+            )
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                raise RetryableResponseError(f"Got status {response.status_code} from {endpoint}")
+            return response
+
+        retries = 0
+
+        def on_retry(error: BaseException, wait_secs: float) -> None:
+            nonlocal retries
+            retries += 1
+            print(with_color(f"\nomegaUp request failed ({error}), retrying in {wait_secs:.1f} seconds...", BColor.WARNING))
+
+        start = time.time()
+        r = with_retries(
+            post,
+            tries=self.tries,
+            backoff_secs=self.backoff_secs,
+            retry_on=(requests.ConnectionError, requests.Timeout, RetryableResponseError),
+            on_retry=on_retry,
+        )
+        TRACER.record(
+            "omegaup",
+            endpoint,
+            time.time() - start,
+            bytes_sent=len(r.request.body or b""),
+            bytes_received=len(r.content),
+            retries=retries,
+            status=r.status_code,
+        )
+        return r
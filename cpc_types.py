@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from datetime import datetime
+from typing import Optional, Tuple, NamedTuple
 
 
 @dataclass(frozen=True)
@@ -21,6 +22,7 @@ class MossHtml:
     problem_alias: str
     language: str
     html_path: str
+    shard_idx: Optional[int] = None
 
 
 @dataclass(frozen=True)
@@ -37,3 +39,59 @@ class Plagiarism:
     @property
     def display_names(self) -> Tuple[str, str]:
         return self.names[0] or self.usernames[0], self.names[1] or self.usernames[1]
+
+    @classmethod
+    def from_dict(cls, plagiarism: dict) -> "Plagiarism":
+        # JSON turns the pairs into lists
+        return cls(**{key: tuple(value) if isinstance(value, list) else value for key, value in plagiarism.items()})
+
+
+@dataclass(frozen=True)
+class MossJob:
+    problem_alias: str
+    language: str
+    file_paths: Tuple[str, ...]
+    # Code shared by most solutions, Moss ignores its matches
+    base_file_paths: Tuple[str, ...] = ()
+    # Set when the solutions of the problem and language are too many for a single job and were split
+    shard_idx: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class CachedMossReport:
+    url: str
+    created_at: float
+    unfiltered_html: str
+
+
+class RunRecord(NamedTuple):
+    """
+    The fields of an omegaUp run that are used by the checks, so runs can be rebuilt from a local store without
+    keeping the whole API object around.
+    """
+    guid: str
+    username: str
+    language: str
+    verdict: str
+    score: float
+    time: datetime
+
+    @classmethod
+    def from_run(cls, run) -> "RunRecord":
+        return cls(
+            guid=run.guid,
+            username=run.username,
+            language=run.language,
+            verdict=run.verdict,
+            score=run.score,
+            time=run.time,
+        )
+
+
+@dataclass(frozen=True)
+class HistoricalMatch:
+    contest_alias: str
+    username: str
+    file_name: str
+    # Percentage of the new file found in the archived one, and the other way around
+    similarity_percs: Tuple[int, int]
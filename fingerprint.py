@@ -0,0 +1,187 @@
+import re
+import zlib
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Set, Pattern
+
+# Tokens per k-gram and k-grams per winnowing window. Any match of at least `WINDOW + K_GRAM - 1` tokens is
+# guaranteed to share a fingerprint, which is about a couple of lines of code.
+K_GRAM = 5
+WINDOW = 4
+
+# Same meaning as Moss' `-m` option: fingerprints found in more files than this are treated as boilerplate
+DEFAULT_IGNORE_LIMIT = 10
+
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1
+
+_STRING = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+_NUMBER = r"\d+(?:\.\d*)?(?:[eE][+-]?\d+)?[a-zA-Z]*|\.\d+"
+_NAME = r"[A-Za-z_]\w*"
+
+_COMMENTS_BY_MOSS_LANG = {
+    "c": r"//[^\n]*|/\*.*?\*/",
+    "cc": r"//[^\n]*|/\*.*?\*/",
+    "csharp#": r"//[^\n]*|/\*.*?\*/",
+    "java": r"//[^\n]*|/\*.*?\*/",
+    "python": r"#[^\n]*",
+    "pascal": r"//[^\n]*|\{.*?\}|\(\*.*?\*\)",
+}
+
+_STRINGS_BY_MOSS_LANG = {
+    "python": r'"""(?:\\.|[^\\])*?"""|\'\'\'(?:\\.|[^\\])*?\'\'\'|' + _STRING,
+    "pascal": r"'(?:''|[^'\n])*'",
+}
+
+# Only keywords and operators are kept verbatim, every other identifier is normalized so renaming variables does
+# not hide a copy
+_KEYWORDS = {
+    "and", "array", "begin", "bool", "boolean", "break", "case", "catch", "char", "class", "const", "continue", "def",
+    "default", "do", "double", "elif", "else", "end", "except", "false", "final", "float", "for", "foreach",
+    "function", "if", "import", "in", "int", "integer", "lambda", "long", "new", "not", "null", "of", "or",
+    "procedure", "program", "public", "private", "readonly", "repeat", "return", "short", "signed", "static",
+    "string", "struct", "switch", "then", "this", "throw", "true", "try", "typedef", "unsigned", "until", "using",
+    "var", "void", "while", "with", "yield",
+}
+
+
+@dataclass(frozen=True)
+class Fingerprints:
+    file_path: str
+    # Maps every selected fingerprint to the source lines it covers
+    lines_by_hash: Dict[int, Set[int]]
+
+
+@dataclass(frozen=True)
+class FileMatch:
+    file_paths: Tuple[str, str]
+    similarity_percs: Tuple[int, int]
+    matched_lines: Tuple[Set[int], Set[int]]
+
+
+def _get_token_regex(moss_lang: str) -> Pattern:
+    alternatives = []
+    if moss_lang in _COMMENTS_BY_MOSS_LANG:
+        alternatives.append(f"(?P<comment>{_COMMENTS_BY_MOSS_LANG[moss_lang]})")
+    alternatives.append(f"(?P<string>{_STRINGS_BY_MOSS_LANG.get(moss_lang, _STRING)})")
+    alternatives.append(f"(?P<number>{_NUMBER})")
+    alternatives.append(f"(?P<name>{_NAME})")
+    alternatives.append(r"(?P<op>\S)")
+    return re.compile("|".join(alternatives), re.DOTALL)
+
+
+_TOKEN_REGEX_BY_MOSS_LANG: Dict[str, Pattern] = {}
+
+
+def tokenize(source: str, moss_lang: str) -> List[Tuple[str, int]]:
+    """
+    Splits the source into normalized tokens, paired with the (zero-based) line where each one starts. Comments are
+    dropped, and identifiers, numbers and strings are replaced by a placeholder.
+    """
+    if moss_lang not in _TOKEN_REGEX_BY_MOSS_LANG:
+        _TOKEN_REGEX_BY_MOSS_LANG[moss_lang] = _get_token_regex(moss_lang)
+    token_regex = _TOKEN_REGEX_BY_MOSS_LANG[moss_lang]
+
+    line_starts = [0]
+    line_starts.extend(match.end() for match in re.finditer("\n", source))
+
+    tokens = []
+    for match in token_regex.finditer(source):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if moss_lang == "ascii":
+            # Plain text is compared word by word
+            token = match.group().lower()
+        elif kind == "name":
+            token = match.group() if match.group() in _KEYWORDS else "V"
+        elif kind == "number":
+            token = "N"
+        elif kind == "string":
+            token = "S"
+        else:
+            token = match.group()
+        tokens.append((token, bisect_right(line_starts, match.start()) - 1))
+    return tokens
+
+
+def fingerprint(file_path: str, source: str, moss_lang: str) -> Fingerprints:
+    """
+    Computes the winnowed k-gram fingerprints of the source: every k-gram of tokens is hashed, and from each window of
+    consecutive hashes only the minimum one is kept.
+    """
+    tokens = tokenize(source, moss_lang)
+    token_ids = [zlib.crc32(token.encode()) for token, _ in tokens]
+    gram_count = len(tokens) - K_GRAM + 1
+    if gram_count <= 0:
+        return Fingerprints(file_path=file_path, lines_by_hash={})
+
+    # Karp-Rabin rolling hash, stable across processes unlike `hash()`, so fingerprints can be persisted
+    top_power = pow(_HASH_BASE, K_GRAM - 1, _HASH_MOD)
+    gram_hash = 0
+    for token_id in token_ids[:K_GRAM]:
+        gram_hash = (gram_hash * _HASH_BASE + token_id) % _HASH_MOD
+    gram_hashes = [gram_hash]
+    for idx in range(K_GRAM, len(token_ids)):
+        gram_hash = (gram_hash - token_ids[idx - K_GRAM] * top_power) % _HASH_MOD
+        gram_hash = (gram_hash * _HASH_BASE + token_ids[idx]) % _HASH_MOD
+        gram_hashes.append(gram_hash)
+
+    lines_by_hash: Dict[int, Set[int]] = {}
+    previous_pos = -1
+    for window_start in range(max(gram_count - WINDOW + 1, 1)):
+        window = gram_hashes[window_start:window_start + WINDOW]
+        # Rightmost minimum, so consecutive windows keep selecting the same k-gram
+        min_hash = min(window)
+        pos = window_start + len(window) - 1 - window[::-1].index(min_hash)
+        if pos == previous_pos:
+            continue
+        previous_pos = pos
+        first_line = tokens[pos][1]
+        last_line = tokens[pos + K_GRAM - 1][1]
+        lines_by_hash.setdefault(min_hash, set()).update(range(first_line, last_line + 1))
+
+    return Fingerprints(file_path=file_path, lines_by_hash=lines_by_hash)
+
+
+def find_matches(
+        fingerprints: List[Fingerprints],
+        min_similarity_perc: int,
+        ignore_limit: int = DEFAULT_IGNORE_LIMIT,
+) -> List[FileMatch]:
+    """
+    Finds the pairs of files that share fingerprints. Instead of comparing all pairs, an inverted index from
+    fingerprint to files yields only the pairs with something in common. The similarity of each file is the
+    percentage of its fingerprints found in the other one, and a match is kept when either file reaches the minimum.
+    """
+    files_by_hash: Dict[int, List[int]] = {}
+    for file_idx, file_fingerprints in enumerate(fingerprints):
+        for fingerprint_hash in file_fingerprints.lines_by_hash:
+            files_by_hash.setdefault(fingerprint_hash, []).append(file_idx)
+
+    shared_hashes_by_pair: Dict[Tuple[int, int], List[int]] = {}
+    for fingerprint_hash, file_idxs in files_by_hash.items():
+        if len(file_idxs) < 2 or len(file_idxs) > ignore_limit:
+            continue
+        for i in range(len(file_idxs)):
+            for j in range(i + 1, len(file_idxs)):
+                shared_hashes_by_pair.setdefault((file_idxs[i], file_idxs[j]), []).append(fingerprint_hash)
+
+    matches = []
+    for (idx_1, idx_2), shared_hashes in shared_hashes_by_pair.items():
+        file_1, file_2 = fingerprints[idx_1], fingerprints[idx_2]
+        perc_1 = len(shared_hashes) * 100 // len(file_1.lines_by_hash)
+        perc_2 = len(shared_hashes) * 100 // len(file_2.lines_by_hash)
+        if max(perc_1, perc_2) < min_similarity_perc:
+            continue
+        lines_1: Set[int] = set()
+        lines_2: Set[int] = set()
+        for fingerprint_hash in shared_hashes:
+            lines_1.update(file_1.lines_by_hash[fingerprint_hash])
+            lines_2.update(file_2.lines_by_hash[fingerprint_hash])
+        matches.append(FileMatch(
+            file_paths=(file_1.file_path, file_2.file_path),
+            similarity_percs=(perc_1, perc_2),
+            matched_lines=(lines_1, lines_2),
+        ))
+    return matches
@@ -0,0 +1,309 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from contextlib import contextmanager, ExitStack
+from typing import Dict, List, Tuple, Iterator, Set, Iterable, Optional
+
+from cpc_types import HistoricalMatch, SuspiciousActivity, RunRecord
+from fingerprint import Fingerprints, fingerprint
+from plagiarism import get_moss_jobs, get_user_from_file_path
+
+FINGERPRINT_INDEX_DIR = os.path.join("cache", "fingerprints")
+
+# Every fingerprint is stored as its hash followed by the id of the document it came from
+_RECORD = struct.Struct("<QI")
+
+# Past the number of segments the lookups get slower than merging them back into one
+MAX_SEGMENTS = 8
+
+# Fingerprints found in more archived documents than this are usually template code, not a copy
+HISTORY_IGNORE_LIMIT = 50
+
+
+class _SegmentHashes:
+    """
+    Sequence view over the hashes of a memory-mapped segment, so `bisect` can search it without loading it.
+    """
+
+    def __init__(self, segment: mmap.mmap) -> None:
+        self._segment = segment
+
+    def __len__(self) -> int:
+        return len(self._segment) // _RECORD.size
+
+    def __getitem__(self, idx: int) -> int:
+        return _RECORD.unpack_from(self._segment, idx * _RECORD.size)[0]
+
+
+class FingerprintIndex:
+    """
+    Persistent index of the fingerprints of every file analyzed in past contests, kept per problem and language.
+
+    Each batch of added files is written as a new segment, a file of (hash, document) records sorted by hash that is
+    memory-mapped and binary searched on lookups. Once there are too many segments they are merged back into one.
+    """
+
+    def __init__(self, index_dir: str = FINGERPRINT_INDEX_DIR) -> None:
+        self.index_dir = index_dir
+
+    def add(
+            self,
+            problem_alias: str,
+            moss_lang: str,
+            contest_alias: str,
+            fingerprints: Iterable[Fingerprints],
+    ) -> int:
+        """
+        Adds the fingerprints of the files of a contest, skipping the files that were already added. Returns how many
+        files were added.
+        """
+        index_path = self._get_index_path(problem_alias, moss_lang)
+        os.makedirs(index_path, exist_ok=True)
+        documents = self._read_documents(index_path)
+        known_documents = {(doc["contest_alias"], doc["username"], doc["file_name"]) for doc in documents}
+
+        new_documents = []
+        records = []
+        for file_fingerprints in fingerprints:
+            document = {
+                "contest_alias": contest_alias,
+                "username": get_user_from_file_path(file_fingerprints.file_path),
+                "file_name": os.path.basename(file_fingerprints.file_path),
+                "fingerprints": len(file_fingerprints.lines_by_hash),
+            }
+            if (document["contest_alias"], document["username"], document["file_name"]) in known_documents:
+                continue
+            doc_id = len(documents) + len(new_documents)
+            new_documents.append(document)
+            records.extend((fingerprint_hash, doc_id) for fingerprint_hash in file_fingerprints.lines_by_hash)
+        if not new_documents:
+            return 0
+
+        # The documents go first, if the segment is never written they only miss their matches, while records
+        # pointing to missing documents would get mixed up with the next ones
+        with open(os.path.join(index_path, "documents.jsonl"), "a") as f:
+            for document in new_documents:
+                f.write(json.dumps(document) + "\n")
+        if records:
+            self._write_segment(index_path, sorted(records))
+
+        if len(self._get_segment_paths(index_path)) > MAX_SEGMENTS:
+            self.compact(problem_alias, moss_lang)
+        return len(new_documents)
+
+    @contextmanager
+    def open(self, problem_alias: str, moss_lang: str) -> Iterator["IndexSnapshot"]:
+        """
+        Reads the documents and maps the segments of the problem and language once, to look up many files. The files
+        added while it's open are not part of it.
+        """
+        index_path = self._get_index_path(problem_alias, moss_lang)
+        with _open_segments(self._get_segment_paths(index_path)) as segments:
+            yield IndexSnapshot(self._read_documents(index_path), segments)
+
+    def lookup(
+            self,
+            problem_alias: str,
+            moss_lang: str,
+            fingerprints: Fingerprints,
+            min_similarity_perc: int,
+            excluded_contest_alias: str = "",
+            ignore_limit: int = HISTORY_IGNORE_LIMIT,
+    ) -> List[HistoricalMatch]:
+        """
+        Looks up a single file, see `IndexSnapshot.lookup`. Opening the index takes as long as reading its documents,
+        use `open` to look up many files.
+        """
+        with self.open(problem_alias, moss_lang) as snapshot:
+            return snapshot.lookup(fingerprints, min_similarity_perc, excluded_contest_alias, ignore_limit)
+
+    def compact(self, problem_alias: str, moss_lang: str) -> None:
+        """
+        Merges all the segments of the problem and language into one, streaming them so they never need to fit in
+        memory together.
+        """
+        index_path = self._get_index_path(problem_alias, moss_lang)
+        segment_paths = self._get_segment_paths(index_path)
+        if len(segment_paths) < 2:
+            return
+
+        with _open_segments(segment_paths) as segments:
+            merged = heapq.merge(*(_iter_records(segment) for segment in segments))
+            self._write_segment(index_path, _unique(merged))
+        for segment_path in segment_paths:
+            os.remove(segment_path)
+
+    def _get_index_path(self, problem_alias: str, moss_lang: str) -> str:
+        return os.path.join(self.index_dir, problem_alias, moss_lang)
+
+    @staticmethod
+    def _read_documents(index_path: str) -> List[Dict]:
+        documents_path = os.path.join(index_path, "documents.jsonl")
+        if not os.path.exists(documents_path):
+            return []
+        with open(documents_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @staticmethod
+    def _get_segment_paths(index_path: str) -> List[str]:
+        if not os.path.isdir(index_path):
+            return []
+        return sorted(
+            os.path.join(index_path, file_name)
+            for file_name in os.listdir(index_path)
+            if file_name.startswith("segment-") and file_name.endswith(".bin")
+        )
+
+    def _write_segment(self, index_path: str, records: Iterable[Tuple[int, int]]) -> None:
+        segment_paths = self._get_segment_paths(index_path)
+        last_number = int(os.path.basename(segment_paths[-1])[len("segment-"):-len(".bin")]) if segment_paths else 0
+        segment_path = os.path.join(index_path, f"segment-{last_number + 1:08d}.bin")
+        # Write to a temporary file first so an interrupted run never leaves a truncated segment behind
+        tmp_path = f"{segment_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(_RECORD.pack(*record))
+        os.replace(tmp_path, segment_path)
+
+
+class IndexSnapshot:
+    """
+    The documents and the memory-mapped segments of a problem and language, read once by `FingerprintIndex.open`.
+    """
+
+    def __init__(self, documents: List[Dict], segments: List[mmap.mmap]) -> None:
+        self.documents = documents
+        self._segments = segments
+
+    def lookup(
+            self,
+            fingerprints: Fingerprints,
+            min_similarity_perc: int,
+            excluded_contest_alias: str = "",
+            ignore_limit: int = HISTORY_IGNORE_LIMIT,
+    ) -> List[HistoricalMatch]:
+        """
+        Finds the archived files that share at least the given percentage of fingerprints with the file, the most
+        similar first. The files of the excluded contest are left out, so a contest never matches itself.
+        """
+        if not fingerprints.lines_by_hash:
+            return []
+
+        shared_counts: Dict[int, int] = {}
+        for fingerprint_hash in fingerprints.lines_by_hash:
+            doc_ids: Set[int] = set()
+            for segment in self._segments:
+                doc_ids.update(_find_doc_ids(segment, fingerprint_hash))
+            if len(doc_ids) > ignore_limit:
+                continue
+            for doc_id in doc_ids:
+                shared_counts[doc_id] = shared_counts.get(doc_id, 0) + 1
+
+        matches = []
+        for doc_id, shared_count in shared_counts.items():
+            document = self.documents[doc_id]
+            if document["contest_alias"] == excluded_contest_alias:
+                continue
+            new_perc = shared_count * 100 // len(fingerprints.lines_by_hash)
+            archived_perc = shared_count * 100 // max(document["fingerprints"], 1)
+            if max(new_perc, archived_perc) < min_similarity_perc:
+                continue
+            matches.append(HistoricalMatch(
+                contest_alias=document["contest_alias"],
+                username=document["username"],
+                file_name=document["file_name"],
+                similarity_percs=(new_perc, archived_perc),
+            ))
+        return sorted(matches, key=lambda m: -max(m.similarity_percs))
+
+
+@contextmanager
+def _open_segments(segment_paths: List[str]) -> Iterator[List[mmap.mmap]]:
+    with ExitStack() as stack:
+        segments = []
+        for segment_path in segment_paths:
+            f = stack.enter_context(open(segment_path, "rb"))
+            segments.append(stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)))
+        yield segments
+
+
+def _find_doc_ids(segment: mmap.mmap, fingerprint_hash: int) -> Iterator[int]:
+    hashes = _SegmentHashes(segment)
+    idx = bisect_left(hashes, fingerprint_hash)
+    while idx < len(hashes):
+        record_hash, doc_id = _RECORD.unpack_from(segment, idx * _RECORD.size)
+        if record_hash != fingerprint_hash:
+            break
+        yield doc_id
+        idx += 1
+
+
+def _iter_records(segment: mmap.mmap) -> Iterator[Tuple[int, int]]:
+    for offset in range(0, len(segment), _RECORD.size):
+        yield _RECORD.unpack_from(segment, offset)
+
+
+def _unique(records: Iterator[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
+    previous = None
+    for record in records:
+        if record != previous:
+            yield record
+        previous = record
+
+
+def check_problem_history(
+        index: FingerprintIndex,
+        contest_alias: str,
+        problem_alias: str,
+        runs_by_username: Dict[str, List[RunRecord]],
+        name_by_username: Dict[str, str],
+        min_similarity_perc: int,
+        max_runs_per_user: Optional[int] = None,
+) -> List[SuspiciousActivity]:
+    """
+    Looks for copies of past contests among the downloaded solutions of the runs of the problem, then adds them to the
+    index so future contests are checked against them too. Other files left in the problem's directory by previous
+    checks are not part of this contest, so they are neither looked up nor added.
+    """
+    run_times = {run.guid: run.time for user_runs in runs_by_username.values() for run in user_runs}
+    # Like the Moss results, each user is reported once, with the most similar archived file of another user
+    best_match_by_username: Dict[str, Tuple[int, str, HistoricalMatch]] = {}
+    for job in get_moss_jobs(problem_alias, run_times, max_runs_per_user):
+        fingerprints = []
+        for file_path in job.file_paths:
+            with open(file_path) as f:
+                fingerprints.append(fingerprint(file_path, f.read(), job.language))
+
+        with index.open(problem_alias, job.language) as snapshot:
+            for file_fingerprints in fingerprints:
+                username = get_user_from_file_path(file_fingerprints.file_path)
+                matches = snapshot.lookup(file_fingerprints, min_similarity_perc, excluded_contest_alias=contest_alias)
+                # Teams may reuse their own code, only the files of other users count
+                match = next((match for match in matches if match.username != username), None)
+                if not match:
+                    continue
+                # The match may pass the threshold by the share of either file, the larger one is reported
+                similarity_perc = max(match.similarity_percs)
+                best_match = best_match_by_username.get(username)
+                if not best_match or similarity_perc > best_match[0]:
+                    best_match_by_username[username] = (
+                        similarity_perc, os.path.basename(file_fingerprints.file_path), match
+                    )
+
+        index.add(problem_alias, job.language, contest_alias, fingerprints)
+
+    return [
+        SuspiciousActivity(
+            username=username,
+            name=name_by_username.get(username),
+            problem_alias=problem_alias,
+            similarity_perc=similarity_perc,
+            reason=f"Code is {similarity_perc}% similar to the code from {match.username} in contest "
+                   f"{match.contest_alias}",
+            details=f"{file_name} vs {match.file_name}",
+        )
+        for username, (similarity_perc, file_name, match) in best_match_by_username.items()
+    ]
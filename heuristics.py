@@ -0,0 +1,392 @@
+import hashlib
+import math
+import multiprocessing
+import re
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple, Deque
+
+import numpy as np
+
+from cpc_types import SuspiciousActivity, RunRecord
+from fingerprint import tokenize, DEFAULT_IGNORE_LIMIT
+from source_store import SourceStore, read_source_object
+from util import get_normalized_extension, OMEGAUP_LANG_EXTENSION, LANG_EXTENSION_TO_MOSS
+
+# Runs of different teams with the same code within this many minutes are reported
+COLLUSION_WINDOW_MINUTES = 10
+# Shorter sources are too generic to tell a shared solution apart
+COLLUSION_MIN_TOKENS = 40
+# Code submitted by more teams than this is usually the obvious solution, not a shared one
+COLLUSION_IGNORE_LIMIT = DEFAULT_IGNORE_LIMIT
+
+_PYTHON_COMMENT_REGEX = re.compile("#")
+_COMMENT_REGEX = re.compile(r"//|/\*")
+_ACCENT_REGEX = re.compile("[áéíóúÁÉÍÓÚ]")
+_EXCEPTION_REGEX = re.compile("Exception|Error")
+_RAW_TOKEN_REGEX = re.compile(r"[A-Za-z_]\w*|\d+|\S")
+
+# Every feature grows with how AI-generated the code looks, so only the positive z-scores add to the score
+STYLE_FEATURES = [
+    "comment density",
+    "accent density",
+    "exception density",
+    "blank lines",
+    "identifier length",
+    "identifier length deviation",
+    "token entropy",
+]
+# Languages with fewer runs in the problem are scored against all the runs of the problem
+STYLE_MIN_GROUP_SIZE = 10
+# Below STYLE_SCORE_THRESHOLD, so a single extreme feature can't flag a run on its own
+STYLE_MAX_Z_SCORE = 4.0
+STYLE_SCORE_THRESHOLD = 8.0
+# Features at least this unusual are listed as the reasons of the score
+STYLE_FEATURE_Z_SCORE = 2.5
+# Problems with fewer runs than STYLE_MIN_GROUP_SIZE can't be scored, so their runs are held to these fixed limits.
+# There is no limit for exceptions, the fixed check only ever counted the first line with one, so it never flagged
+FIXED_MAX_COMMENTS = 3
+FIXED_MAX_ACCENTS = 0
+
+
+@dataclass(frozen=True)
+class SourceSignals:
+    line_count: int
+    blank_line_count: int
+    comment_count: int
+    accent_count: int
+    exception_count: int
+    matching_lines: Set[str]
+
+
+def scan_source(source: str, language: str) -> SourceSignals:
+    """
+    Computes all the signals of AI-generated code in a single pass over the lines of the source.
+    """
+    comment_regex = _PYTHON_COMMENT_REGEX if language.startswith("py") else _COMMENT_REGEX
+    lines = source.split("\n")
+    blank_line_count = 0
+    comment_count = 0
+    accent_count = 0
+    exception_count = 0
+    matching_lines = set()
+    for line in lines:
+        if not line.strip():
+            blank_line_count += 1
+            continue
+
+        if comment_regex.search(line):
+            comment_count += 1
+            matching_lines.add(line)
+
+        line_accent_count = len(_ACCENT_REGEX.findall(line))
+        if line_accent_count:
+            accent_count += line_accent_count
+            matching_lines.add(line)
+
+        if _EXCEPTION_REGEX.search(line):
+            exception_count += 1
+            matching_lines.add(line)
+
+    return SourceSignals(
+        line_count=len(lines),
+        blank_line_count=blank_line_count,
+        comment_count=comment_count,
+        accent_count=accent_count,
+        exception_count=exception_count,
+        matching_lines=matching_lines,
+    )
+
+
+def get_style_features(source: str, signals: SourceSignals) -> List[float]:
+    """
+    Turns the source into a row of numbers describing its style, in the order of `STYLE_FEATURES`.
+    """
+    code_line_count = max(signals.line_count - signals.blank_line_count, 1)
+    tokens = _RAW_TOKEN_REGEX.findall(source)
+    identifier_lengths = [len(token) for token in tokens if token[0].isalpha() or token[0] == "_"]
+    token_counts: Dict[str, int] = {}
+    for token in tokens:
+        token_counts[token] = token_counts.get(token, 0) + 1
+    entropy = -sum(count / len(tokens) * math.log2(count / len(tokens)) for count in token_counts.values())
+
+    identifier_mean_length = sum(identifier_lengths) / len(identifier_lengths) if identifier_lengths else 0.0
+    identifier_length_std = math.sqrt(
+        sum((length - identifier_mean_length) ** 2 for length in identifier_lengths) / len(identifier_lengths)
+    ) if identifier_lengths else 0.0
+    return [
+        signals.comment_count / code_line_count,
+        signals.accent_count / code_line_count,
+        signals.exception_count / code_line_count,
+        signals.blank_line_count / max(signals.line_count, 1),
+        identifier_mean_length,
+        identifier_length_std,
+        entropy,
+    ]
+
+
+def get_style_z_scores(features: np.ndarray, groups: List[str]) -> np.ndarray:
+    """
+    Scores how unusual each feature of each row is compared to the other rows of its group, as robust z-scores based
+    on the median and the median absolute deviation so the outliers don't hide themselves. Groups with too few rows
+    are compared with all the rows instead, and with too few rows in total every z-score is zero.
+    """
+    z_scores = np.zeros_like(features)
+    if len(features) < STYLE_MIN_GROUP_SIZE:
+        return z_scores
+
+    group_names, group_idxs, group_sizes = np.unique(np.asarray(groups), return_inverse=True, return_counts=True)
+    group_idxs = np.where(group_sizes[group_idxs] >= STYLE_MIN_GROUP_SIZE, group_idxs, -1)
+    for group_idx in np.unique(group_idxs):
+        rows = group_idxs == group_idx
+        reference = features[rows] if group_idx >= 0 else features
+        median = np.median(reference, axis=0)
+        deviations = np.abs(reference - median)
+        # Features that are the same for most rows, like accents, have no median deviation, use the mean instead
+        scale = np.where(
+            np.median(deviations, axis=0) > 0,
+            1.4826 * np.median(deviations, axis=0),
+            1.2533 * np.mean(deviations, axis=0),
+        )
+        z_scores[rows] = np.divide(
+            features[rows] - median, scale, out=np.zeros_like(features[rows]), where=scale > 0
+        )
+    return np.clip(z_scores, -STYLE_MAX_Z_SCORE, STYLE_MAX_Z_SCORE)
+
+
+def create_heuristics_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Starts the processes that scan the runs, meant to be shared by all the problems of a check. They are spawned
+    instead of forked: a process forked while other threads run, like the Moss jobs or the workers of the service,
+    can be left waiting forever on a lock that one of those threads held.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def check_suspicious_activity(
+        runs_by_username: Dict[str, List[RunRecord]],
+        source_store: SourceStore,
+        problem_alias: str,
+        name_by_username: Dict[str, Optional[str]],
+        workers: int,
+        collusion_window_minutes: int = COLLUSION_WINDOW_MINUTES,
+        executor: Optional[ProcessPoolExecutor] = None,
+) -> List[SuspiciousActivity]:
+    """
+    Uses the processes of the executor when given, see `create_heuristics_executor`, otherwise starts `workers`
+    processes only for this problem.
+    """
+    print(f"Checking suspicious activity for problem {problem_alias}")
+    # Only where each source is saved is sent to the workers, they read the sources themselves one user at a time
+    user_args = [
+        (runs, {run.guid: source_store.get_object_path(run.guid) for run in runs}, bool(collusion_window_minutes))
+        for runs in runs_by_username.values()
+    ]
+    if workers > 1 and len(user_args) > 1:
+        with ExitStack() as stack:
+            if not executor:
+                executor = stack.enter_context(create_heuristics_executor(workers))
+            scans = list(executor.map(
+                _scan_user_runs,
+                *zip(*user_args),
+                chunksize=max(len(user_args) // (workers * 4), 1),
+            ))
+    else:
+        scans = [_scan_user_runs(*args) for args in user_args]
+
+    # The style of every run is scored at once against the runs of the same language
+    features = np.array(
+        [row for scan in scans for row in scan.style_features], dtype=float
+    ).reshape(-1, len(STYLE_FEATURES))
+    z_scores = get_style_z_scores(features, [language for scan in scans for language in scan.style_languages])
+    scores = np.clip(z_scores, 0, None).sum(axis=1)
+
+    # There are too few runs to tell what is unusual for the problem, the fixed limits are used instead
+    use_fixed_limits = len(features) < STYLE_MIN_GROUP_SIZE
+
+    activities = []
+    first_row = 0
+    for username, scan in zip(runs_by_username.keys(), scans):
+        warnings = set(scan.warnings)
+        if use_fixed_limits:
+            warnings.update(scan.fixed_limit_warnings)
+        user_rows = slice(first_row, first_row + len(scan.style_features))
+        first_row = user_rows.stop
+        if user_rows.stop > user_rows.start:
+            best_row = user_rows.start + int(np.argmax(scores[user_rows]))
+            if scores[best_row] >= STYLE_SCORE_THRESHOLD:
+                unusual_features = ", ".join(
+                    f"{feature} z={z_score:.1f}"
+                    for feature, z_score in zip(STYLE_FEATURES, z_scores[best_row])
+                    if z_score >= STYLE_FEATURE_Z_SCORE
+                )
+                warnings.add(f"Style is unusual for this problem (score {scores[best_row]:.1f}): {unusual_features}")
+        if not warnings:
+            continue
+
+        suspicious_lines = {line.strip() for line in scan.suspicious_lines}
+        warnings_desc = [f"  - {w}" for w in sorted(warnings)]
+        activities.append(SuspiciousActivity(
+            username=username,
+            name=name_by_username.get(username),
+            problem_alias=problem_alias,
+            similarity_perc=None,
+            reason="Code might be AI-generated:\n" + "\n".join(warnings_desc),
+            details="\n".join(sorted(suspicious_lines)),
+        ))
+
+    if collusion_window_minutes:
+        source_hash_by_run_id = {
+            run_id: source_hash for scan in scans for run_id, source_hash in scan.source_hash_by_run_id.items()
+        }
+        activities.extend(_check_temporal_collusion(
+            runs_by_username,
+            source_hash_by_run_id,
+            problem_alias,
+            name_by_username,
+            timedelta(minutes=collusion_window_minutes),
+        ))
+    return activities
+
+
+def _check_temporal_collusion(
+        runs_by_username: Dict[str, List[RunRecord]],
+        source_hash_by_run_id: Dict[str, str],
+        problem_alias: str,
+        name_by_username: Dict[str, Optional[str]],
+        window: timedelta,
+) -> List[SuspiciousActivity]:
+    """
+    Finds teams that submitted the same normalized code within the window of each other, which is how a solution
+    shared during the contest shows up. The runs are sorted by time and swept once, keeping only the runs inside the
+    window, so the whole problem is checked in O(n log n). Code submitted by many teams is usually the obvious
+    solution rather than a shared one, and it's ignored.
+    """
+    usernames_by_hash: Dict[str, Set[str]] = {}
+    for username, runs in runs_by_username.items():
+        for run in runs:
+            if run.guid in source_hash_by_run_id:
+                usernames_by_hash.setdefault(source_hash_by_run_id[run.guid], set()).add(username)
+    timeline = sorted(
+        (run.time, username, source_hash_by_run_id[run.guid])
+        for username, runs in runs_by_username.items()
+        for run in runs
+        if run.guid in source_hash_by_run_id
+        and 1 < len(usernames_by_hash[source_hash_by_run_id[run.guid]]) <= COLLUSION_IGNORE_LIMIT
+    )
+
+    # Closest earlier submission of the same code by each other team, for each team
+    minutes_by_other_by_username: Dict[str, Dict[Tuple[str, bool], int]] = {}
+    window_runs: Deque[Tuple[datetime, str, str]] = deque()
+    window_runs_by_hash: Dict[str, Deque[Tuple[datetime, str]]] = {}
+    for run_time, username, source_hash in timeline:
+        while window_runs and run_time - window_runs[0][0] > window:
+            _, _, old_hash = window_runs.popleft()
+            window_runs_by_hash[old_hash].popleft()
+
+        for other_time, other_username in window_runs_by_hash.get(source_hash, []):
+            if other_username == username:
+                continue
+            minutes = math.ceil((run_time - other_time).total_seconds() / 60)
+            for user, other, is_later in ((username, other_username, True), (other_username, username, False)):
+                minutes_by_other = minutes_by_other_by_username.setdefault(user, {})
+                minutes_by_other[(other, is_later)] = min(minutes_by_other.get((other, is_later), minutes), minutes)
+
+        window_runs.append((run_time, username, source_hash))
+        window_runs_by_hash.setdefault(source_hash, deque()).append((run_time, username))
+
+    activities = []
+    for username, minutes_by_other in sorted(minutes_by_other_by_username.items()):
+        warnings = []
+        for (other_username, is_later), minutes in sorted(minutes_by_other.items()):
+            other_name = name_by_username.get(other_username)
+            other_display_name = f"{other_name} ({other_username})" if other_name else other_username
+            when = "after" if is_later else "before"
+            warnings.append(f"  - Same code as {other_display_name}, {minutes} minutes {when} them")
+        activities.append(SuspiciousActivity(
+            username=username,
+            name=name_by_username.get(username),
+            problem_alias=problem_alias,
+            similarity_perc=None,
+            reason="Submitted the same code as other teams within minutes:\n" + "\n".join(warnings),
+            details="",
+        ))
+    return activities
+
+
+@dataclass(frozen=True)
+class _UserScan:
+    warnings: Set[str]
+    # Only reported when the problem has too few runs to score their style
+    fixed_limit_warnings: Set[str]
+    suspicious_lines: Set[str]
+    source_hash_by_run_id: Dict[str, str]
+    # One row per run with source code, in the same order
+    style_features: List[List[float]]
+    style_languages: List[str]
+
+
+def _scan_user_runs(
+        runs: List[RunRecord],
+        source_path_by_run_id: Dict[str, Optional[str]],
+        hash_sources: bool,
+) -> _UserScan:
+    """
+    Reads every source of the user once: checks the runs for language switches, and computes the style features and,
+    when hashing, the hash of the normalized source of each run, so the whole tokenization happens in the worker
+    processes. The hashes are only needed to check for temporal collusion.
+    """
+    languages = set()
+    previous_run = None
+    warnings = set()
+    fixed_limit_warnings = set()
+    suspicious_lines = set()
+    source_hash_by_run_id = {}
+    style_features = []
+    style_languages = []
+    for run in runs:
+        source_path = source_path_by_run_id[run.guid]
+        source = read_source_object(source_path) if source_path else ""
+        if not source:
+            continue
+
+        if hash_sources:
+            moss_lang = LANG_EXTENSION_TO_MOSS.get(OMEGAUP_LANG_EXTENSION.get(run.language, ".txt"), "ascii")
+            tokens = [token for token, _ in tokenize(source, moss_lang)]
+            if len(tokens) >= COLLUSION_MIN_TOKENS:
+                source_hash_by_run_id[run.guid] = hashlib.sha1(" ".join(tokens).encode()).hexdigest()
+
+        extension = get_normalized_extension(run.language)
+        languages.add(extension)
+        if previous_run:
+            previous_extension = get_normalized_extension(previous_run.language)
+            if extension != previous_extension:
+                time_diff = run.time - previous_run.time
+                if time_diff < timedelta(minutes=15):
+                    warnings.add(f"Used different languages within {math.ceil(time_diff.total_seconds() / 60)} minutes")
+
+        signals = scan_source(source, run.language)
+        suspicious_lines.update(signals.matching_lines)
+        if signals.comment_count > FIXED_MAX_COMMENTS:
+            fixed_limit_warnings.add(f"Code has {signals.comment_count} comments")
+        if signals.accent_count > FIXED_MAX_ACCENTS:
+            fixed_limit_warnings.add(f"Code has {signals.accent_count} accents")
+        style_features.append(get_style_features(source, signals))
+        style_languages.append(extension)
+
+        previous_run = run
+
+    if len(languages) > 1:
+        warnings.add(f"Used more than one language: {languages}")
+
+    return _UserScan(
+        warnings=warnings,
+        fixed_limit_warnings=fixed_limit_warnings,
+        suspicious_lines=suspicious_lines,
+        source_hash_by_run_id=source_hash_by_run_id,
+        style_features=style_features,
+        style_languages=style_languages,
+    )
@@ -1,41 +1,34 @@
 import argparse
+import bisect
 import csv
+import itertools
+import json
 import time
-from datetime import timedelta
-from typing import Optional, List, Dict, Tuple, Set
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import Optional, List, Dict, Tuple, Set, Iterable, Iterator, TextIO
 
 import omegaup.api
 import os
 import math
 
-from plagiarism import check_plagiarism
-from template.template import generate_html_report
-from terminal import with_color, BColor
-from cpc_types import SuspiciousActivity
-
-from util import get_credentials_from_file, print_table, get_school_name
-
-OMEGAUP_LANG_EXTENSION = {
-    "c11-clang": ".c",
-    "c11-gcc": ".c",
-    "cpp11-clang": ".cpp",
-    "cpp11-gcc": ".cpp",
-    "cpp17-clang": ".cpp",
-    "cpp17-gcc": ".cpp",
-    "cpp20-clang": ".cpp",
-    "cpp20-gcc": ".cpp",
-    "cs": ".cs",
-    "java": ".java",
-    "kj": ".java",
-    "kp": ".pascal",
-    "py2": ".py",
-    "py3": ".py",
-}
-
-def _get_normalized_extension(lang: str) -> str:
-    extension = OMEGAUP_LANG_EXTENSION[lang]
-    return ".cpp" if extension == ".c" else extension
+from client import PooledClient
+from plagiarism import check_plagiarism, PlagiarismCheck, MOSS_MAX_FILES_PER_JOB
+from template.template import generate_html_report, generate_sharded_report
+from terminal import with_color, BColor, Progress
+from cpc_types import SuspiciousActivity, Plagiarism, RunRecord
+from run_store import RunStore
+from source_store import SourceStore
+from checkpoint import Checkpoint
+from tracing import TRACER
 
+from fingerprint_index import FingerprintIndex, check_problem_history
+from moss_archive import archive_moss_pages
+from service import CheckService, serve, SERVICE_HOST
+from heuristics import check_suspicious_activity, create_heuristics_executor, COLLUSION_WINDOW_MINUTES
+from util import (
+    get_credentials_from_file, print_table, get_school_name, get_normalized_extension, OMEGAUP_LANG_EXTENSION,
+)
 
 def _choose_contest_interactively(contest_class: omegaup.api.Contest) -> str:
     contests = contest_class.adminList()
@@ -54,199 +47,336 @@ def _choose_contest_interactively(contest_class: omegaup.api.Contest) -> str:
     return contests.contests[contest_idx].alias
 
 
-def _choose_problems_interactively(problems: omegaup.api.ContestProblemsResponse) -> List[str]:
+def _choose_problems_interactively(problem_aliases: List[str]) -> List[str]:
     columns = [[0, "all"]]
 
-    for idx, problem in enumerate(problems.problems):
-        columns.append([str(idx + 1), problem.alias])
+    for idx, problem_alias in enumerate(problem_aliases):
+        columns.append([str(idx + 1), problem_alias])
 
     print("\nPlease select a problem:")
 
     print_table(columns)
 
     problem_idx = int(input("Enter the problem number: "))
-    while problem_idx < 0 or problem_idx >= len(problems.problems) + 1:
+    while problem_idx < 0 or problem_idx >= len(problem_aliases) + 1:
         print("Invalid problem number")
         problem_idx = int(input("Enter the problem number: "))
 
     if problem_idx == 0:
         # return an array of problem aliases
-        return [problem.alias for problem in problems.problems]
-    return [problems.problems[problem_idx - 1].alias]
+        return problem_aliases
+    return [problem_aliases[problem_idx - 1]]
+
+
+def _list_runs_by_problem(
+        contest_class: omegaup.api.Contest,
+        problem_aliases_by_contest: Dict[str, List[str]],
+        page_size: int,
+        workers: int,
+        known_guids_by_problem: Optional[Dict[str, Set[str]]] = None,
+) -> Dict[str, Dict[str, List[RunRecord]]]:
+    """
+    Lists the runs of all the problems concurrently. The first page of each problem tells how many runs there are, so
+    the rest of its pages are requested as soon as it arrives, and every page is merged into its problem's runs as it
+    comes in. The runs of each user are ordered by submission time. When several contests share a problem, the runs
+    of all of them are merged into the same problem. Only the fields the checks need are kept from each run.
+
+    When the already known runs are given, only the new ones are returned. omegaUp lists the newest runs first, so the
+    pages of each problem are requested one after the other until one of them reaches a known run.
+    """
+    contest_problems = [
+        (contest_alias, problem_alias)
+        for contest_alias, problem_aliases in problem_aliases_by_contest.items()
+        for problem_alias in problem_aliases
+    ]
+    problem_aliases = list(dict.fromkeys(problem_alias for _, problem_alias in contest_problems))
+    print(f"Listing the runs of {len(problem_aliases)} problems with {workers} workers...")
+    runs_by_username_by_problem: Dict[str, Dict[str, List[RunRecord]]] = {
+        problem_alias: {} for problem_alias in problem_aliases
+    }
+    seen_guids_by_problem: Dict[str, Set[str]] = {problem_alias: set() for problem_alias in problem_aliases}
+    total_runs_by_problem: Dict[str, int] = {problem_alias: 0 for problem_alias in problem_aliases}
+
+    def fetch_page(
+            contest_alias: str,
+            problem_alias: str,
+            offset: int,
+    ) -> Tuple[str, str, int, omegaup.api.ContestRunsResponse]:
+        response = contest_class.runs(
+            contest_alias=contest_alias,
+            problem_alias=problem_alias,
+            offset=offset,
+            rowcount=page_size,
+        )
+        return contest_alias, problem_alias, offset, response
+
+    progress = Progress(len(contest_problems), "pages")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {
+            executor.submit(fetch_page, contest_alias, problem_alias, 0)
+            for contest_alias, problem_alias in contest_problems
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                contest_alias, problem_alias, offset, response = future.result()
+                known_guids = known_guids_by_problem[problem_alias] if known_guids_by_problem is not None else None
+                if offset == 0:
+                    total_runs_by_problem[problem_alias] += response.totalRuns
+                    if known_guids is None:
+                        for page_offset in range(page_size, response.totalRuns, page_size):
+                            pending.add(executor.submit(fetch_page, contest_alias, problem_alias, page_offset))
+                            progress.total += 1
+
+                # Pages can overlap when new runs arrive while listing a live contest
+                runs_by_username = runs_by_username_by_problem[problem_alias]
+                seen_guids = seen_guids_by_problem[problem_alias]
+                reached_known_run = False
+                for run in response.runs:
+                    if known_guids is not None and run.guid in known_guids:
+                        reached_known_run = True
+                    elif run.guid not in seen_guids:
+                        seen_guids.add(run.guid)
+                        runs_by_username.setdefault(run.username, []).append(RunRecord.from_run(run))
+                progress.advance()
+
+                next_offset = offset + page_size
+                if known_guids is not None and not reached_known_run and next_offset < response.totalRuns:
+                    pending.add(executor.submit(fetch_page, contest_alias, problem_alias, next_offset))
+                    progress.total += 1
+    progress.finish()
+
+    for problem_alias, runs_by_username in runs_by_username_by_problem.items():
+        for user_runs in runs_by_username.values():
+            # Order by submission time
+            user_runs.sort(key=lambda r: r.time)
+        run_count = len(seen_guids_by_problem[problem_alias])
+        total_runs = total_runs_by_problem[problem_alias]
+        if known_guids_by_problem is not None:
+            print(f"Got {run_count} new runs for problem {problem_alias}")
+            continue
+        print(f"Got {run_count} runs for problem {problem_alias}")
+        if run_count < total_runs:
+            print(with_color(f"Did not get all runs! Got {run_count} but expected {total_runs}", BColor.WARNING))
+
+    return runs_by_username_by_problem
 
 
 def _download_runs_for_problem(
         run_class: omegaup.api.Run,
-        runs_by_username: Dict[str, List[omegaup.api._Run]],
+        source_store: SourceStore,
+        runs_by_username: Dict[str, List[RunRecord]],
         problem_alias: str,
-) -> Dict[str, str]:
+        workers: int,
+) -> None:
+    """
+    Saves the source of every run in the store, unless it's already there. The sources are not kept in memory, the
+    checks read them from the store when they need them.
+    """
     print(f"Saving their source code locally...")
-    source_by_run_id = {}
-    for username, user_runs in runs_by_username.items():
-        path = os.path.join("generated", problem_alias, username)
-        os.makedirs(path, exist_ok=True)
-        for run in user_runs:
-            language = run.language
-            extension = None
-            for lang, ext in OMEGAUP_LANG_EXTENSION.items():
-                if language.startswith(lang):
-                    extension = ext
-            if not extension:
-                print(with_color(f"Extension for language {language} not found", BColor.WARNING))
-                extension = ".txt"
-
-            score = math.floor(run.score * 100)
-            file_name = (
-                f"{run.guid}_{username}_{problem_alias}_{run.verdict}_{score}{extension}"
-            )
-            file_path = os.path.join(path, file_name)
-            if os.path.exists(file_path):
-                # Avoid re-downloading, but read the file so it can be set
-                with open(file_path) as f:
-                    source_by_run_id[run.guid] = "\n".join(f.readlines())
-                continue
-
-            try:
-                source = _get_source_from_run(run_class, run.guid)
-            except Exception:
-                if run.verdict != "JE":
-                    raise
-                print(f"Run {run.guid} has a Judge Error verdict and no source code is available")
-                source = ""
+    pending_downloads = [
+        run for user_runs in runs_by_username.values() for run in user_runs if run.guid not in source_store
+    ]
 
-            source_by_run_id[run.guid] = source
-            if source:
-                with open(file_path, "w") as f:
-                    f.write(source)
+    if pending_downloads:
+        print(f"Downloading {len(pending_downloads)} runs with {workers} workers...")
+        progress = Progress(len(pending_downloads), "runs")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_download_run, run_class, source_store, run) for run in pending_downloads]
+            for future in as_completed(futures):
+                future.result()
+                progress.advance()
+        progress.finish()
 
     print("Source code saved!")
-    return source_by_run_id
 
 
-def _get_source_from_run(run_class, run_alias: str) -> str:
-    source = run_class.source(run_alias=run_alias)
-    return source.source
+def _download_run(run_class: omegaup.api.Run, source_store: SourceStore, run: RunRecord) -> None:
+    try:
+        source = _get_source_from_run(run_class, run.guid)
+    except Exception:
+        if run.verdict != "JE":
+            raise
+        print(f"\nRun {run.guid} has a Judge Error verdict and no source code is available")
+        source = ""
 
+    if source:
+        source_store.put(run.guid, source)
 
-def _count_comments(source: List[str], language: str) -> Tuple[int, Set[str]]:
-    comment_starts = ["#"] if language.startswith("py") else ["//", "/*"]
-    count = 0
-    matching_lines = set()
-    for line in source:
-        for comment_start in comment_starts:
-            if comment_start in line:
-                count += 1
-                matching_lines.add(line)
-                break
-    return count, matching_lines
-
-
-def _count_accents(source: List[str]) -> Tuple[int, Set[str]]:
-    count = 0
-    matching_lines = set()
-    for line in source:
-        for char in line.lower():
-            if char in "áéíóú":
-                count += 1
-                matching_lines.add(line)
-    return count, matching_lines
-
-
-def _count_exceptions(source: List[str]) -> Tuple[int, Set[str]]:
-    count = 0
-    matching_lines = set()
-    for line in source:
-        if "Exception" in line or "Error" in line:
-            count += 1
-            matching_lines.add(line)
-            break
-    return count, matching_lines
-
-
-def _check_suspicious_activity(
-        runs_by_username: Dict[str, List[omegaup.api._Run]],
-        source_by_run_id: Dict[str, str],
+
+def _get_run_file_path(run: RunRecord, problem_alias: str) -> str:
+    language = run.language
+    extension = None
+    for lang, ext in OMEGAUP_LANG_EXTENSION.items():
+        if language.startswith(lang):
+            extension = ext
+    if not extension:
+        print(with_color(f"Extension for language {language} not found", BColor.WARNING))
+        extension = ".txt"
+
+    score = math.floor(run.score * 100)
+    file_name = f"{run.guid}_{run.username}_{problem_alias}_{run.verdict}_{score}{extension}"
+    return os.path.join("generated", problem_alias, run.username, file_name)
+
+
+def _write_run_files(
+        runs_by_username: Dict[str, List[RunRecord]],
+        source_store: SourceStore,
         problem_alias: str,
-        name_by_username: Dict[str, str],
-) -> List[SuspiciousActivity]:
-    print(f"Checking suspicious activity for problem {problem_alias}")
-    suspicious_activity = []
-    for username, runs in runs_by_username.items():
-        languages = set()
-        previous_run = None
-        warnings = set()
-        suspicious_lines = set()
-        for run in runs:
-            source = source_by_run_id[run.guid]
+) -> None:
+    """
+    Writes the source of each run as generated/<problem>/<user>/<file>, the view the plagiarism engines read. The
+    files that are already there are listed once instead of being checked one by one.
+    """
+    existing_file_paths = {
+        os.path.join(dir_path, file_name)
+        for dir_path, _, file_names in os.walk(os.path.join("generated", problem_alias))
+        for file_name in file_names
+    }
+    for user_runs in runs_by_username.values():
+        for run in user_runs:
+            file_path = _get_run_file_path(run, problem_alias)
+            if file_path in existing_file_paths:
+                continue
+            source = source_store.get(run.guid)
             if not source:
                 continue
 
-            source_lines = source.split("\n")
-            extension = _get_normalized_extension(run.language)
-            languages.add(extension)
-            if previous_run:
-                previous_extension = _get_normalized_extension(previous_run.language)
-                if extension != previous_extension:
-                    time_diff = run.time - previous_run.time
-                    if time_diff < timedelta(minutes=15):
-                        warnings.add(f"Used different languages within {math.ceil(time_diff.total_seconds() / 60)} minutes")
-
-            comment_count, comment_lines = _count_comments(source_lines, run.language)
-            suspicious_lines.update(comment_lines)
-            if comment_count > 3:
-                warnings.add(f"Code has {comment_count} comments")
-
-            accent_count, accent_lines = _count_accents(source_lines)
-            suspicious_lines.update(accent_lines)
-            if accent_count > 0:
-                warnings.add(f"Code has {accent_count} accents")
-
-            exception_count, exception_lines = _count_exceptions(source_lines)
-            suspicious_lines.update(exception_lines)
-            if exception_count > 1:
-                warnings.add(f"Code has {exception_count} exceptions")
-
-            previous_run = run
-
-        if len(languages) > 1:
-            warnings.add(f"Used more than one language: {languages}")
-
-        suspicious_lines = {line.strip() for line in suspicious_lines}
-        if warnings:
-            warnings_desc = [f"  - {w}" for w in sorted(warnings)]
-            suspicious_activity.append(SuspiciousActivity(
-                username=username,
-                name=name_by_username.get(username),
-                problem_alias=problem_alias,
-                similarity_perc=None,
-                reason="Code might be AI-generated:\n" + "\n".join(warnings_desc),
-                details="\n".join(sorted(suspicious_lines)),
-            ))
-
-    return suspicious_activity
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as f:
+                f.write(source)
+
+
+def _get_contest_problem_aliases(
+        contest_class: omegaup.api.Contest,
+        contest_aliases: List[str],
+) -> Dict[str, List[str]]:
+    return {
+        contest_alias: [problem.alias for problem in contest_class.problems(contest_alias=contest_alias).problems]
+        for contest_alias in contest_aliases
+    }
+
+
+def _get_scoreboard(contest_class: omegaup.api.Contest, contest_aliases: List[str]) -> Dict[str, dict]:
+    """
+    Returns the name, the total points and the points in each problem of every user in the scoreboards.
+    """
+    name_by_username: Dict[str, Optional[str]] = {}
+    total_points_by_username: Dict[str, float] = {}
+    problem_points_by_username: Dict[str, Dict[str, float]] = {}
+    for contest_alias in contest_aliases:
+        with TRACER.stage("scoreboard", contest_alias=contest_alias):
+            ranking = contest_class.scoreboard(contest_alias=contest_alias).ranking
+        for rank in ranking:
+            name_by_username[rank.username] = rank.name
+            # Users in several contests add up the points of all of them
+            total_points_by_username.setdefault(rank.username, 0.0)
+            total_points_by_username[rank.username] += rank.total.points
+            user_problem_points = problem_points_by_username.setdefault(rank.username, {})
+            for problem_points in rank.problems:
+                user_problem_points[problem_points.alias] = max(
+                    user_problem_points.get(problem_points.alias, 0.0), problem_points.points
+                )
+    return {
+        "names": name_by_username,
+        "total_points": total_points_by_username,
+        "problem_points": problem_points_by_username,
+    }
+
+
+def _get_top_usernames(total_points_by_username: Dict[str, float], top_teams: int) -> Set[str]:
+    """
+    Returns the users of the top teams by total points, including the ones tied with the last of them.
+    """
+    ranked_points = sorted(total_points_by_username.values(), reverse=True)[:top_teams]
+    if not ranked_points:
+        return set()
+    return {username for username, points in total_points_by_username.items() if points >= ranked_points[-1]}
+
+
+def _select_target_runs(
+        runs_by_username: Dict[str, List[RunRecord]],
+        problem_alias: str,
+        target_usernames: Optional[Set[str]],
+        problem_points_by_username: Dict[str, Dict[str, float]],
+        min_problem_points: Optional[float],
+        nearby_window: Optional[timedelta],
+) -> Dict[str, List[RunRecord]]:
+    """
+    Keeps the runs of the target users that got points in the problem, at least the minimum ones when given. With a
+    nearby window, the runs of the users that submitted in the same language within the window of a run of a target
+    are kept too, since they are the ones that could have shared their code with a target.
+    """
+    def is_target(username: str) -> bool:
+        points = problem_points_by_username.get(username, {}).get(problem_alias, 0.0)
+        in_targets = target_usernames is None or username in target_usernames
+        return in_targets and points > 0 and points >= (min_problem_points or 0)
+
+    selected_usernames = {username for username in runs_by_username if is_target(username)}
+    target_count = len(selected_usernames)
+    if nearby_window:
+        target_times_by_language: Dict[str, List[datetime]] = {}
+        for username in selected_usernames:
+            for run in runs_by_username[username]:
+                target_times_by_language.setdefault(_get_language_family(run.language), []).append(run.time)
+        for times in target_times_by_language.values():
+            times.sort()
+
+        for username, user_runs in runs_by_username.items():
+            if username not in selected_usernames and any(
+                _has_time_within(target_times_by_language.get(_get_language_family(run.language), []), run.time,
+                                 nearby_window)
+                for run in user_runs
+            ):
+                selected_usernames.add(username)
+
+    nearby_desc = f", plus {len(selected_usernames) - target_count} that submitted close to them" if nearby_window else ""
+    print(f"Checking {target_count} of the {len(runs_by_username)} teams of problem {problem_alias}{nearby_desc}")
+    return {username: runs for username, runs in runs_by_username.items() if username in selected_usernames}
+
+
+def _has_time_within(sorted_times: List[datetime], time: datetime, window: timedelta) -> bool:
+    idx = bisect.bisect_left(sorted_times, time - window)
+    return idx < len(sorted_times) and sorted_times[idx] <= time + window
+
+
+def _get_language_family(language: str) -> str:
+    return get_normalized_extension(language) if language in OMEGAUP_LANG_EXTENSION else language
+
+
+def _get_source_from_run(run_class, run_alias: str) -> str:
+    source = run_class.source(run_alias=run_alias)
+    return source.source
 
 
 def _generate_activity_report(
-        suspicious_activities: List[SuspiciousActivity],
+        suspicious_activities: Iterable[SuspiciousActivity],
         total_points_by_username: Dict[str, float],
         problem_points_by_username: Dict[str, Dict[str, float]],
         file_path: str,
 ) -> None:
+    """
+    Writes one row per activity, sorted by school and team. With --streaming the rows are appended as each problem is
+    checked instead, unsorted.
+    """
     print(with_color(f"\nGenerating suspicious activity report at {file_path}", BColor.OK_CYAN))
     activities = sorted(suspicious_activities, key=lambda a: (
         get_school_name(a.display_name) or "", a.display_name, a.problem_alias, a.reason
     ))
     with open(file_path, "w") as csvfile:
-        writer = csv.DictWriter(
-            csvfile,
-            quoting=csv.QUOTE_ALL,
-            escapechar="\\",
-            fieldnames=[
-                "School", "Name", "User", "Problem", "Problem score", "Total score", "Similarity", "Reason", "Details",
-            ],
-        )
-        writer.writeheader()
-        for activity in activities:
+        _get_activity_writer(csvfile).writeheader()
+    _append_activity_rows(activities, total_points_by_username, problem_points_by_username, file_path)
+
+
+def _append_activity_rows(
+        suspicious_activities: Iterable[SuspiciousActivity],
+        total_points_by_username: Dict[str, float],
+        problem_points_by_username: Dict[str, Dict[str, float]],
+        file_path: str,
+) -> None:
+    with open(file_path, "a") as csvfile:
+        writer = _get_activity_writer(csvfile)
+        for activity in suspicious_activities:
             writer.writerow({
                 "School": get_school_name(activity.display_name),
                 "Name": activity.display_name,
@@ -260,108 +390,475 @@ def _generate_activity_report(
             })
 
 
+def _get_activity_writer(csvfile: TextIO) -> csv.DictWriter:
+    return csv.DictWriter(
+        csvfile,
+        quoting=csv.QUOTE_ALL,
+        escapechar="\\",
+        fieldnames=[
+            "School", "Name", "User", "Problem", "Problem score", "Total score", "Similarity", "Reason", "Details",
+        ],
+    )
+
+
+def _get_plagiarism_activities(plagiarisms: Iterable[Plagiarism]) -> Iterator[SuspiciousActivity]:
+    for plag in plagiarisms:
+        for user_idx in range(2):
+            other_user_idx = 1 - user_idx
+            yield SuspiciousActivity(
+                username=plag.usernames[user_idx],
+                name=plag.names[user_idx],
+                problem_alias=plag.problem_alias,
+                similarity_perc=plag.similarity_perc,
+                reason=f"Code is {plag.similarity_perc}% similar to the code from {plag.display_names[other_user_idx]}",
+                details=plag.results_url,
+            )
+
+
 def _main(
-        contest_alias: Optional[str],
+        contest_aliases: List[str],
         problem_alias: Optional[str],
         should_check_plagiarism: bool,
         min_plagiarism_perc: int,
         check_diff_schools: bool,
+        download_workers: int,
+        list_workers: int,
+        runs_page_size: int,
+        plagiarism_engine: str,
+        moss_workers: int,
+        use_moss_cache: bool,
+        moss_max_files: int,
+        incremental: bool,
+        max_runs_per_user: Optional[int],
+        heuristic_workers: int,
+        pipeline: bool,
+        streaming: bool,
+        check_history: bool,
+        compress_sources: bool,
+        report_format: str,
+        archive_moss_workers: int,
+        collusion_window_minutes: int,
+        top_teams: Optional[int],
+        min_problem_points: Optional[float],
+        include_nearby_teams: bool,
+        resume: bool,
+        trace_path: Optional[str],
+        serve_port: Optional[int],
+        serve_host: str,
+        service_token: Optional[str],
+        service_workers: int,
 ) -> None:
+    if trace_path:
+        TRACER.enable()
+    start_time = time.time()
+    if serve_port and not os.path.isfile("login.txt"):
+        print(with_color("The service can't ask for the credentials, run a check first to save them", BColor.FAIL))
+        return
     username, password, moss_user_id = get_credentials_from_file("login.txt")
 
-    client_class = omegaup.api.Client(username=username, password=password)
+    client_class = PooledClient(username=username, password=password, pool_size=max(download_workers, list_workers))
     contest_class = omegaup.api.Contest(client=client_class)
     run_class = omegaup.api.Run(client=client_class)
+    check_options = dict(
+        should_check_plagiarism=should_check_plagiarism,
+        min_plagiarism_perc=min_plagiarism_perc,
+        check_diff_schools=check_diff_schools,
+        download_workers=download_workers,
+        list_workers=list_workers,
+        runs_page_size=runs_page_size,
+        plagiarism_engine=plagiarism_engine,
+        moss_workers=moss_workers,
+        use_moss_cache=use_moss_cache,
+        moss_max_files=moss_max_files,
+        incremental=incremental,
+        max_runs_per_user=max_runs_per_user,
+        heuristic_workers=heuristic_workers,
+        pipeline=pipeline,
+        streaming=streaming,
+        check_history=check_history,
+        compress_sources=compress_sources,
+        report_format=report_format,
+        archive_moss_workers=archive_moss_workers,
+        collusion_window_minutes=collusion_window_minutes,
+        top_teams=top_teams,
+        min_problem_points=min_problem_points,
+        include_nearby_teams=include_nearby_teams,
+        resume=resume,
+    )
+
+    if serve_port:
+        # The same logged in client is shared by every job, and every job is incremental so refreshing is cheap
+        service = CheckService(
+            lambda job, report_dir: _run_check(
+                contest_class,
+                run_class,
+                moss_user_id,
+                job.contest_aliases,
+                job.problem_alias,
+                report_dir,
+                # The activities of each job are kept to be served, so they are not streamed, and a failed job
+                # starts again from scratch the next time
+                **{**check_options, **job.options, "incremental": True, "streaming": False, "resume": False},
+            ),
+            lambda job_contest_aliases: list(dict.fromkeys(
+                alias
+                for problem_aliases in _get_contest_problem_aliases(contest_class, job_contest_aliases).values()
+                for alias in problem_aliases
+            )),
+            service_workers,
+        )
+        serve(service, serve_port, serve_host, service_token)
+        return
 
-    contest_alias = contest_alias if contest_alias else _choose_contest_interactively(contest_class)
-    problems = contest_class.problems(contest_alias=contest_alias)
+    if not contest_aliases:
+        contest_aliases = [_choose_contest_interactively(contest_class)]
+    try:
+        _run_check(contest_class, run_class, moss_user_id, contest_aliases, problem_alias, ".", **check_options)
+    except (Exception, KeyboardInterrupt):
+        print(with_color(
+            "\nThe check stopped, run it again with --resume to continue from where it stopped", BColor.FAIL
+        ))
+        raise
+    finally:
+        # The traces of the checks that failed or were interrupted are the ones most worth looking at
+        if trace_path:
+            TRACER.record("stage", "total", time.time() - start_time, start=start_time)
+            print(with_color(f"\nSaving the trace at {trace_path}", BColor.OK_CYAN))
+            TRACER.write_json(trace_path)
+            TRACER.print_summary()
+
+
+def _run_check(
+        contest_class: omegaup.api.Contest,
+        run_class: omegaup.api.Run,
+        moss_user_id: str,
+        contest_aliases: List[str],
+        problem_alias: Optional[str],
+        report_dir: str,
+        should_check_plagiarism: bool,
+        min_plagiarism_perc: int,
+        check_diff_schools: bool,
+        download_workers: int,
+        list_workers: int,
+        runs_page_size: int,
+        plagiarism_engine: str,
+        moss_workers: int,
+        use_moss_cache: bool,
+        moss_max_files: int,
+        incremental: bool,
+        max_runs_per_user: Optional[int],
+        heuristic_workers: int,
+        pipeline: bool,
+        streaming: bool,
+        check_history: bool,
+        compress_sources: bool,
+        report_format: str,
+        archive_moss_workers: int,
+        collusion_window_minutes: int,
+        top_teams: Optional[int],
+        min_problem_points: Optional[float],
+        include_nearby_teams: bool,
+        resume: bool,
+) -> Tuple[List[SuspiciousActivity], List[Plagiarism]]:
+    """
+    Checks the problems of the contests and writes the reports inside the report directory. Returns the suspicious
+    activities found by the heuristics and the plagiarisms, which are reported as activities too.
+
+    When streaming, the problems are listed and checked one at a time, and the activities of each problem are written
+    to the report as soon as it's checked instead of being returned, so the memory used doesn't grow with the contest.
+    """
+    # A contest given twice is only looked up and listed once
+    contest_aliases = list(dict.fromkeys(contest_aliases))
+    contest_problem_aliases = _get_contest_problem_aliases(contest_class, contest_aliases)
+    all_problem_aliases = list(dict.fromkeys(
+        alias for problem_aliases in contest_problem_aliases.values() for alias in problem_aliases
+    ))
     if problem_alias == "all":
-        problem_aliases = [problem.alias for problem in problems.problems]
+        problem_aliases = all_problem_aliases
     elif problem_alias:
         problem_aliases = [problem_alias]
     else:
-        problem_aliases = _choose_problems_interactively(problems)
+        problem_aliases = _choose_problems_interactively(all_problem_aliases)
+    for missing_alias in set(problem_aliases) - set(all_problem_aliases):
+        print(with_color(f"Problem {missing_alias} is not part of any of the contests, skipping it", BColor.WARNING))
+    problem_aliases = [alias for alias in problem_aliases if alias in all_problem_aliases]
+    # The runs of a problem shared by several contests are downloaded and compared together
+    problem_aliases_by_contest = {
+        contest_alias: [alias for alias in problem_aliases if alias in contest_problem_aliases[contest_alias]]
+        for contest_alias in contest_aliases
+    }
 
-    name_by_username: Dict[str, Optional[str]] = {}
-    total_points_by_username: Dict[str, float] = {}
-    problem_points_by_username: Dict[str, Dict[str, float]] = {}
-    for rank in contest_class.scoreboard(contest_alias=contest_alias).ranking:
-        name_by_username[rank.username] = rank.name
-        total_points_by_username[rank.username] = rank.total.points
-        for problem_points in rank.problems:
-            problem_points_by_username.setdefault(rank.username, {})[problem_points.alias] = problem_points.points
+    # Stored results are only reused when they were produced with the same options
+    analysis_options = json.dumps(
+        [
+            should_check_plagiarism,
+            min_plagiarism_perc,
+            check_diff_schools,
+            plagiarism_engine,
+            check_history,
+            collusion_window_minutes,
+            top_teams,
+            min_problem_points,
+            include_nearby_teams,
+            max_runs_per_user,
+            moss_max_files,
+        ]
+    )
+    checkpoint = Checkpoint([contest_aliases, problem_aliases, analysis_options, incremental], resume)
+    if resume:
+        print(f"Resuming the check from {checkpoint.checkpoint_dir}")
+
+    scoreboard = checkpoint.get("scoreboard")
+    if scoreboard:
+        print("Reusing the scoreboard of the interrupted check")
+    else:
+        scoreboard = _get_scoreboard(contest_class, contest_aliases)
+        checkpoint.save("scoreboard", scoreboard)
+    name_by_username: Dict[str, Optional[str]] = scoreboard["names"]
+    total_points_by_username: Dict[str, float] = scoreboard["total_points"]
+    problem_points_by_username: Dict[str, Dict[str, float]] = scoreboard["problem_points"]
 
+    # The runs of a batch of contests are stored together, as if they were a single contest
+    contest_alias = ",".join(contest_aliases)
     print(f"Getting the code of all runs for {len(problem_aliases)} problems for contest {contest_alias}")
-    suspicious_counts = {}
+    run_store = RunStore() if incremental else None
+    # When targeting, only the runs of the teams that matter for the awards are downloaded and compared
+    targeted = top_teams is not None or min_problem_points is not None
+    target_usernames = _get_top_usernames(total_points_by_username, top_teams) if top_teams is not None else None
+    nearby_window = timedelta(minutes=collusion_window_minutes or COLLUSION_WINDOW_MINUTES) \
+        if include_nearby_teams else None
+    known_guids_by_problem = {
+        problem_alias: run_store.get_known_guids(contest_alias, problem_alias) for problem_alias in problem_aliases
+    } if run_store else None
+    fingerprint_index = FingerprintIndex() if check_history else None
+    source_store = SourceStore(compress=compress_sources)
+    imported_sources = source_store.import_run_files("generated")
+    if imported_sources:
+        print(f"Imported {imported_sources} sources downloaded before {source_store.store_dir} existed")
+
+    suspicious_names: Set[str] = set()
     suspicious_activities: List[SuspiciousActivity] = []
-    for problem_alias in problem_aliases:
-        print(with_color(f"\nGetting the runs for problem {problem_alias}", BColor.BOLD))
-        response = contest_class.runs(contest_alias=contest_alias, problem_alias=problem_alias, rowcount=10000)
-        runs = response.runs
-        if response.totalRuns != len(runs):
-            print(with_color(f"Did not get all runs! Got {len(runs)} but expected {response.totalRuns}", BColor.WARNING))
-        # Order by submission time
-        runs = sorted(runs, key=lambda r: r.time)
-        runs_by_username = {}
-        for run in runs:
-            runs_by_username.setdefault(run.username, []).append(run)
-
-        source_by_run_id = _download_runs_for_problem(run_class, runs_by_username, problem_alias)
-        suspicious_activities.extend(
-            _check_suspicious_activity(runs_by_username, source_by_run_id, problem_alias, name_by_username)
-        )
+    stored_plagiarisms: List[Plagiarism] = []
+    analyzed_problem_aliases: List[str] = []
+    # With --streaming they aren't kept, they are read back from the checkpoint when the analyses are stored
+    activities_by_problem: Dict[str, List[SuspiciousActivity]] = {}
+    # The submission time of the runs of each problem that is compared after all of them are checked
+    run_times_by_problem: Dict[str, Dict[str, datetime]] = {}
+    # When pipelined, the solutions of each problem are compared while the next problems are being downloaded. With
+    # --streaming too, so the runs of each problem are released once its comparison is queued
+    plagiarism_check = PlagiarismCheck(
+        moss_user_id,
+        min_plagiarism_perc,
+        name_by_username,
+        check_diff_schools,
+        plagiarism_engine,
+        moss_workers,
+        use_moss_cache,
+        max_runs_per_user,
+        moss_max_files,
+        checkpoint,
+    ) if (pipeline or streaming) and should_check_plagiarism else None
+    # Starting the processes takes a while, they are shared by all the problems
+    heuristics_executor = create_heuristics_executor(heuristic_workers) if heuristic_workers > 1 else None
+    activity_report_path = os.path.join(report_dir, "suspicious_activity.csv")
 
-    print()
-    if should_check_plagiarism:
-        tries = 3
-        while True:
-            try:
+    def add_activities(activities: List[SuspiciousActivity]) -> None:
+        suspicious_names.update(activity.display_name for activity in activities)
+        if streaming:
+            _append_activity_rows(
+                activities, total_points_by_username, problem_points_by_username, activity_report_path
+            )
+        else:
+            suspicious_activities.extend(activities)
+
+    def list_runs(listed_problem_aliases: List[str]) -> Dict[str, Dict[str, List[RunRecord]]]:
+        runs_by_username_by_problem = {}
+        for listed_problem_alias in listed_problem_aliases:
+            checkpointed_runs = checkpoint.get_runs(f"runs:{listed_problem_alias}")
+            if checkpointed_runs is not None:
+                runs_by_username_by_problem[listed_problem_alias] = checkpointed_runs
+        if runs_by_username_by_problem:
+            print(f"Reusing the runs of {len(runs_by_username_by_problem)} problems listed by the interrupted check")
+
+        unlisted_problem_aliases = [
+            alias for alias in listed_problem_aliases if alias not in runs_by_username_by_problem
+        ]
+        if unlisted_problem_aliases:
+            listed_runs = _list_runs_by_problem(
+                contest_class,
+                {
+                    contest_alias: [alias for alias in contest_problem_aliases if alias in unlisted_problem_aliases]
+                    for contest_alias, contest_problem_aliases in problem_aliases_by_contest.items()
+                },
+                runs_page_size,
+                list_workers,
+                known_guids_by_problem,
+            )
+            for listed_problem_alias, runs_by_username in listed_runs.items():
+                checkpoint.save_runs(f"runs:{listed_problem_alias}", runs_by_username)
+            runs_by_username_by_problem.update(listed_runs)
+        return runs_by_username_by_problem
+
+    # A check stopped by an error or Ctrl+C must not leave the queued Moss jobs running until the program exits
+    try:
+        if streaming:
+            _generate_activity_report([], total_points_by_username, problem_points_by_username, activity_report_path)
+        else:
+            with TRACER.stage("listing"):
+                runs_by_username_by_problem = list_runs(problem_aliases)
+        for problem_alias in problem_aliases:
+            print(with_color(f"\nProcessing the runs for problem {problem_alias}", BColor.BOLD))
+            if streaming:
+                with TRACER.stage("listing", problem_alias=problem_alias):
+                    runs_by_username = list_runs([problem_alias])[problem_alias]
+            else:
+                # The runs of each problem are released as soon as the problem is checked
+                runs_by_username = runs_by_username_by_problem.pop(problem_alias)
+            if run_store:
+                new_runs = [run for user_runs in runs_by_username.values() for run in user_runs]
+                stored_analysis = run_store.get_analysis(contest_alias, problem_alias, analysis_options)
+                if not new_runs and stored_analysis:
+                    print("No new runs since the last sync, reusing the previous results")
+                    add_activities(stored_analysis[0])
+                    stored_plagiarisms.extend(stored_analysis[1])
+                    continue
+                run_store.add_runs(contest_alias, problem_alias, new_runs)
+                # The checks look at the whole history of each user, not only at the new runs
+                runs_by_username = run_store.get_runs_by_username(contest_alias, problem_alias)
+            if targeted:
+                # Every run is still stored, so a later check with other targets doesn't miss any
+                runs_by_username = _select_target_runs(
+                    runs_by_username,
+                    problem_alias,
+                    target_usernames,
+                    problem_points_by_username,
+                    min_problem_points,
+                    nearby_window,
+                )
+
+            analyzed_problem_aliases.append(problem_alias)
+            activities_unit = f"activities:{problem_alias}"
+            problem_activities = checkpoint.get_activities(activities_unit)
+            checkpointed_activities = problem_activities is not None
+            if checkpointed_activities:
+                # Its runs were already downloaded, into the source store
+                print("Reusing the suspicious activities found by the interrupted check")
+            else:
+                with TRACER.stage("download", problem_alias=problem_alias):
+                    _download_runs_for_problem(
+                        run_class, source_store, runs_by_username, problem_alias, download_workers
+                    )
+                with TRACER.stage("heuristics", problem_alias=problem_alias):
+                    problem_activities = check_suspicious_activity(
+                        runs_by_username,
+                        source_store,
+                        problem_alias,
+                        name_by_username,
+                        heuristic_workers,
+                        collusion_window_minutes,
+                        heuristics_executor,
+                    )
+            if should_check_plagiarism or fingerprint_index:
+                with TRACER.stage("write_files", problem_alias=problem_alias):
+                    _write_run_files(runs_by_username, source_store, problem_alias)
+            if fingerprint_index and not checkpointed_activities:
+                with TRACER.stage("history", problem_alias=problem_alias):
+                    problem_activities.extend(check_problem_history(
+                        fingerprint_index,
+                        contest_alias,
+                        problem_alias,
+                        runs_by_username,
+                        name_by_username,
+                        min_plagiarism_perc,
+                        max_runs_per_user,
+                    ))
+            if not checkpointed_activities:
+                checkpoint.save_activities(activities_unit, problem_activities)
+            add_activities(problem_activities)
+            if run_store:
+                if not streaming:
+                    # Kept until the plagiarisms of the problem are known, to store them together
+                    activities_by_problem[problem_alias] = problem_activities
+                run_store.set_source_hashes({
+                    run.guid: source_store.get_hash(run.guid)
+                    for user_runs in runs_by_username.values()
+                    for run in user_runs
+                    if run.guid in source_store
+                })
+            if should_check_plagiarism:
+                run_times = {run.guid: run.time for user_runs in runs_by_username.values() for run in user_runs}
+                if plagiarism_check:
+                    plagiarism_check.submit(problem_alias, run_times)
+                else:
+                    run_times_by_problem[problem_alias] = run_times
+
+        print()
+        if plagiarism_check:
+            with TRACER.stage("plagiarism"):
+                plagiarisms = plagiarism_check.wait()
+        elif should_check_plagiarism:
+            with TRACER.stage("plagiarism"):
                 plagiarisms = check_plagiarism(
                     moss_user_id,
-                    problem_aliases,
+                    run_times_by_problem,
                     min_plagiarism_perc,
                     name_by_username,
                     check_diff_schools,
-                )
-                break
-            except ConnectionResetError:
-                tries -= 1
-                if tries <= 0:
-                    print(with_color("Error talking to MOSS after 3 tries", BColor.FAIL))
-                    raise
-                wait_secs = 60
-                print(with_color(f"MOSS failed, retrying in {wait_secs} seconds...", BColor.WARNING))
-                time.sleep(wait_secs)
-
-        for plag in plagiarisms:
-            for user_idx in range(2):
-                other_user_idx = 1 - user_idx
-                suspicious_activities.append(SuspiciousActivity(
-                    username=plag.usernames[user_idx],
-                    name=plag.names[user_idx],
-                    problem_alias=plag.problem_alias,
-                    similarity_perc=plag.similarity_perc,
-                    reason=f"Code is {plag.similarity_perc}% similar to the code from {plag.display_names[other_user_idx]}",
-                    details=plag.results_url,
-                ))
-    else:
-        plagiarisms = []
-        print("The plagiarism check has been skipped")
+                    plagiarism_engine,
+                    moss_workers,
+                    use_moss_cache,
+                    max_runs_per_user,
+                    moss_max_files,
+                    checkpoint,
+                ) if run_times_by_problem else []
+        else:
+            plagiarisms = []
+            print("The plagiarism check has been skipped")
+    finally:
+        if plagiarism_check:
+            plagiarism_check.close()
+        if heuristics_executor:
+            heuristics_executor.shutdown(cancel_futures=True)
 
-    _generate_activity_report(
-        suspicious_activities,
-        total_points_by_username,
-        problem_points_by_username,
-        "suspicious_activity.csv",
-    )
+    if run_store:
+        for problem_alias in analyzed_problem_aliases:
+            problem_activities = activities_by_problem.pop(problem_alias, None)
+            if problem_activities is None:
+                problem_activities = checkpoint.get_activities(f"activities:{problem_alias}") or []
+            run_store.save_analysis(
+                contest_alias,
+                problem_alias,
+                analysis_options,
+                problem_activities,
+                [plag for plag in plagiarisms if plag.problem_alias == problem_alias],
+            )
+        run_store.close()
+        plagiarisms = sorted(plagiarisms + stored_plagiarisms, key=lambda p: -p.similarity_perc)
+
+    if archive_moss_workers and plagiarisms:
+        with TRACER.stage("moss_archive"):
+            plagiarisms = archive_moss_pages(plagiarisms, archive_moss_workers)
 
-    for activity in suspicious_activities:
-        name = activity.name or activity.username
-        suspicious_counts.setdefault(name, 0)
-        suspicious_counts[name] += 1
+    # The activities of each plagiarism are created as they are written, they can be many with a low minimum
+    with TRACER.stage("activity_report"):
+        if streaming:
+            _append_activity_rows(
+                _get_plagiarism_activities(plagiarisms),
+                total_points_by_username,
+                problem_points_by_username,
+                activity_report_path,
+            )
+        else:
+            _generate_activity_report(
+                itertools.chain(suspicious_activities, _get_plagiarism_activities(plagiarisms)),
+                total_points_by_username,
+                problem_points_by_username,
+                activity_report_path,
+            )
+    suspicious_names.update(activity.display_name for activity in _get_plagiarism_activities(plagiarisms))
 
     suspicious_school_counts = {}
-    for name in suspicious_counts.keys():
+    for name in suspicious_names:
         school = get_school_name(name)
         if school:
             suspicious_school_counts.setdefault(school, 0)
@@ -377,14 +874,46 @@ def _main(
             print(f"  - {school}: {count} suspicious teams")
 
     if should_check_plagiarism:
-        generate_html_report(plagiarisms, "plagiarism_report.html")
+        with TRACER.stage("plagiarism_report"):
+            if report_format == "sharded":
+                generate_sharded_report(plagiarisms, os.path.join(report_dir, "plagiarism_report"))
+            else:
+                generate_html_report(plagiarisms, os.path.join(report_dir, "plagiarism_report.html"))
+
+    # The check finished, the next one starts from scratch
+    checkpoint.clear()
+    return suspicious_activities, plagiarisms
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog="moss", description="Check code plagiarism in omegaUp via Moss")
-    parser.add_argument("-c", "--contest", help="Contest alias to check")
+    parser.add_argument(
+        "-c",
+        "--contest",
+        nargs="+",
+        help="Contest aliases to check, the runs of the problems shared by several contests are compared together",
+    )
     parser.add_argument("-p", "--problem", help="Problem alias to check, use 'all' for all contest problems")
     parser.add_argument("--skip-plagiarism", action="store_true", help="Skip doing the plagiarism check with Moss")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last check of the same contests and problems with the same options from where it stopped, "
+             "reusing its scoreboard, runs, suspicious activities and plagiarism results",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["moss", "local"],
+        default="moss",
+        help="Engine for the plagiarism check: 'moss' uploads to Moss, 'local' compares fingerprints offline",
+    )
+    parser.add_argument(
+        "--report-format",
+        choices=["html", "sharded"],
+        default="html",
+        help="'html' writes plagiarism_report.html with every result, 'sharded' writes the results in small files "
+             "inside plagiarism_report/ with a viewer that pages, filters and sorts them, for very large results",
+    )
     parser.add_argument(
         "--min-plagiarism-perc",
         default=80,
@@ -396,12 +925,182 @@ if __name__ == "__main__":
         action="store_true",
         help="Display plagiarism findings between different schools, only relevant when there are schools",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch and analyze the runs that arrived since the last incremental check, using a local database",
+    )
+    parser.add_argument(
+        "--max-runs-per-user",
+        type=int,
+        help="Maximum number of distinct runs of each user that are compared, always including the latest and the "
+             "best scored ones, defaults to all of them",
+    )
+    parser.add_argument(
+        "--heuristic-workers",
+        default=os.cpu_count(),
+        type=int,
+        help="Number of processes that check the runs for AI-generated code, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--collusion-window-minutes",
+        default=COLLUSION_WINDOW_MINUTES,
+        type=int,
+        help="Report teams that submitted the same code within this many minutes of each other, 0 disables it, "
+             f"defaults to {COLLUSION_WINDOW_MINUTES}",
+    )
+    parser.add_argument(
+        "--top-teams",
+        type=int,
+        help="Only download and check the runs of the top teams by total points, and of the teams tied with them",
+    )
+    parser.add_argument(
+        "--min-problem-points",
+        type=float,
+        help="Only download and check the runs of each problem of the teams with at least these points in it",
+    )
+    parser.add_argument(
+        "--include-nearby-teams",
+        action="store_true",
+        help="With --top-teams or --min-problem-points, also check the teams that submitted in the same language "
+             "within the collusion window of a run of the checked teams",
+    )
+    parser.add_argument(
+        "--trace",
+        "--profile",
+        dest="trace_path",
+        help="Save the time, calls, bytes and retries of every stage, omegaUp API call and Moss job to this JSON file",
+    )
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help="Also compare the solutions with the ones of the contests previously checked with this flag, which are "
+             "kept in a local index",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Send the solutions of each problem to the plagiarism check as soon as they are downloaded, instead of "
+             "waiting for all the problems",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="List and check the problems one at a time, writing the suspicious activities of each one as soon as "
+             "it's checked, so the memory used stays the same for contests of any size. Implies --pipeline. The "
+             "report is not sorted",
+    )
+    parser.add_argument(
+        "--moss-workers",
+        default=4,
+        type=int,
+        help="Number of problem and language jobs sent to Moss concurrently, defaults to 4",
+    )
+    parser.add_argument(
+        "--moss-max-files",
+        default=MOSS_MAX_FILES_PER_JOB,
+        type=int,
+        help="Maximum number of files sent in a single Moss job, larger problems are split into overlapping jobs "
+             f"that are merged afterwards, defaults to {MOSS_MAX_FILES_PER_JOB}",
+    )
+    parser.add_argument(
+        "--archive-moss",
+        action="store_true",
+        help="Save the Moss match pages of the plagiarisms found inside moss_archive/ and link the report to them, "
+             "since Moss deletes its results after 14 days",
+    )
+    parser.add_argument(
+        "--archive-workers",
+        default=8,
+        type=int,
+        help="Number of Moss pages saved concurrently with --archive-moss, defaults to 8",
+    )
+    parser.add_argument(
+        "--no-moss-cache",
+        action="store_true",
+        help="Always send the files to Moss, even if the exact same files were sent in the last 14 days",
+    )
+    parser.add_argument(
+        "--no-source-compression",
+        action="store_true",
+        help="Store the downloaded source code uncompressed in cache/sources",
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=8080,
+        type=int,
+        dest="serve_port",
+        help="Run as a service that takes checks over HTTP in this port, defaults to 8080, see service.py for its API. "
+             "The other options are the defaults of its checks, which are always incremental",
+    )
+    parser.add_argument(
+        "--host",
+        default=SERVICE_HOST,
+        dest="serve_host",
+        help=f"Address the service listens on, defaults to {SERVICE_HOST} so only this machine can reach it",
+    )
+    parser.add_argument(
+        "--service-token",
+        help="Token that every request to the service must bring, as an 'Authorization: Bearer' header or a 'token' "
+             "query parameter, defaults to a random one printed when the service starts",
+    )
+    parser.add_argument(
+        "--service-workers",
+        default=2,
+        type=int,
+        help="Number of checks that the service runs at the same time, defaults to 2",
+    )
+    parser.add_argument(
+        "--download-workers",
+        default=8,
+        type=int,
+        help="Number of runs whose source code is downloaded concurrently, defaults to 8",
+    )
+    parser.add_argument(
+        "--list-workers",
+        default=4,
+        type=int,
+        help="Number of pages of runs that are listed concurrently, defaults to 4",
+    )
+    parser.add_argument(
+        "--runs-page-size",
+        default=1000,
+        type=int,
+        help="Number of runs requested per page when listing the runs of a problem, defaults to 1000",
+    )
     args = parser.parse_args()
 
     _main(
-        contest_alias=args.contest,
+        contest_aliases=args.contest or [],
         problem_alias=args.problem,
         should_check_plagiarism=not args.skip_plagiarism,
         min_plagiarism_perc=args.min_plagiarism_perc,
         check_diff_schools=args.check_diff_schools,
+        download_workers=args.download_workers,
+        list_workers=args.list_workers,
+        runs_page_size=args.runs_page_size,
+        plagiarism_engine=args.engine,
+        moss_workers=args.moss_workers,
+        use_moss_cache=not args.no_moss_cache,
+        moss_max_files=args.moss_max_files,
+        incremental=args.incremental,
+        max_runs_per_user=args.max_runs_per_user,
+        heuristic_workers=args.heuristic_workers,
+        trace_path=args.trace_path,
+        pipeline=args.pipeline,
+        streaming=args.streaming,
+        check_history=args.history,
+        compress_sources=not args.no_source_compression,
+        report_format=args.report_format,
+        archive_moss_workers=args.archive_workers if args.archive_moss else 0,
+        collusion_window_minutes=args.collusion_window_minutes,
+        top_teams=args.top_teams,
+        min_problem_points=args.min_problem_points,
+        include_nearby_teams=args.include_nearby_teams,
+        resume=args.resume,
+        serve_port=args.serve_port,
+        serve_host=args.serve_host,
+        service_token=args.service_token,
+        service_workers=args.service_workers,
     )
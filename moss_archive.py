@@ -0,0 +1,146 @@
+import dataclasses
+import os
+import re
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Set, Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cpc_types import Plagiarism
+from terminal import with_color, BColor, Progress
+from tracing import TRACER
+from util import with_retries
+
+MOSS_ARCHIVE_DIR = "moss_archive"
+
+ARCHIVE_TRIES = 3
+ARCHIVE_BACKOFF_SECS = 2.0
+
+# The match pages of Moss are framesets, and their frames show images to mark the matched code
+_LINKED_PAGE_REGEX = re.compile(r'<(?:FRAME|IFRAME|IMG)\b[^>]*\bSRC="?([^" >]+)', re.IGNORECASE)
+
+
+def archive_moss_pages(
+        plagiarisms: Iterable[Plagiarism],
+        workers: int,
+        archive_dir: str = MOSS_ARCHIVE_DIR,
+) -> List[Plagiarism]:
+    """
+    Saves the Moss match page of every plagiarism, with its frames and images, before Moss deletes them. The pages
+    keep their path under the archive, so their relative links keep working offline. Returns the plagiarisms with
+    their results pointing to the local copies, except for the ones whose page or any of its frames and images
+    couldn't be saved.
+    """
+    plagiarisms = list(plagiarisms)
+    match_urls = list(dict.fromkeys(plag.results_url for plag in plagiarisms if "://" in plag.results_url))
+    if not match_urls:
+        return plagiarisms
+
+    print(with_color(f"\nArchiving {len(match_urls)} Moss match pages with {workers} workers...", BColor.OK_CYAN))
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+
+    seen_urls: Set[str] = set(match_urls)
+    failed_urls: Set[str] = set()
+    linked_urls_by_url: Dict[str, List[str]] = {}
+    progress = Progress(len(match_urls), "pages")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_archive_page, http, url, archive_dir): url for url in match_urls}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    linked_urls = future.result()
+                except (requests.RequestException, OSError) as e:
+                    print(with_color(f"\nCould not archive {url}: {e}", BColor.WARNING))
+                    failed_urls.add(url)
+                    linked_urls = []
+                linked_urls_by_url[url] = linked_urls
+                # Frames and images are shared by many pages, each one is only fetched once
+                for linked_url in linked_urls:
+                    if linked_url not in seen_urls:
+                        seen_urls.add(linked_url)
+                        pending[executor.submit(_archive_page, http, linked_url, archive_dir)] = linked_url
+                        progress.total += 1
+                progress.advance()
+    progress.finish()
+    http.close()
+
+    # An incomplete copy would hide the evidence that Moss still shows, so those keep linking to Moss
+    incomplete_urls = {url for url in match_urls if _has_failed_url(url, linked_urls_by_url, failed_urls)}
+    if incomplete_urls:
+        print(with_color(f"{len(incomplete_urls)} Moss match pages could not be saved completely", BColor.WARNING))
+    archived_plagiarisms = []
+    for plag in plagiarisms:
+        if "://" in plag.results_url and plag.results_url not in incomplete_urls:
+            plag = dataclasses.replace(plag, results_url=_get_archive_path(plag.results_url, archive_dir))
+        archived_plagiarisms.append(plag)
+    print(f"The Moss match pages have been saved locally inside: {archive_dir}")
+    return archived_plagiarisms
+
+
+def _archive_page(http: requests.Session, url: str, archive_dir: str) -> List[str]:
+    """
+    Saves the page, unless it was saved by a previous check, and returns the absolute URLs of the pages and images
+    it links to.
+    """
+    archive_path = _get_archive_path(url, archive_dir)
+    if os.path.exists(archive_path):
+        with open(archive_path, "rb") as f:
+            content = f.read()
+    else:
+        def get() -> requests.Response:
+            response = http.get(url, timeout=60)
+            response.raise_for_status()
+            return response
+
+        response = with_retries(
+            get,
+            tries=ARCHIVE_TRIES,
+            backoff_secs=ARCHIVE_BACKOFF_SECS,
+            retry_on=(requests.ConnectionError, requests.Timeout),
+        )
+        content = response.content
+        TRACER.record("moss_archive", url, response.elapsed.total_seconds(), bytes_received=len(content))
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a truncated page behind
+        tmp_path = f"{archive_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, archive_path)
+
+    if not archive_path.lower().endswith((".html", ".htm")):
+        return []
+    return [
+        urllib.parse.urldefrag(urllib.parse.urljoin(url, link))[0]
+        for link in _LINKED_PAGE_REGEX.findall(content.decode(errors="replace"))
+    ]
+
+
+def _has_failed_url(url: str, linked_urls_by_url: Dict[str, List[str]], failed_urls: Set[str]) -> bool:
+    """
+    Tells whether the page, or any of the pages and images it links to directly or through its frames, failed.
+    """
+    pending_urls = [url]
+    seen_urls = {url}
+    while pending_urls:
+        page_url = pending_urls.pop()
+        if page_url in failed_urls:
+            return True
+        for linked_url in linked_urls_by_url.get(page_url, []):
+            if linked_url not in seen_urls:
+                seen_urls.add(linked_url)
+                pending_urls.append(linked_url)
+    return False
+
+
+def _get_archive_path(url: str, archive_dir: str) -> str:
+    parsed_url = urllib.parse.urlparse(url)
+    path = parsed_url.path.strip("/") or "index.html"
+    # The links between the pages are relative, mirroring the server keeps them pointing to the right copies
+    return os.path.join(archive_dir, parsed_url.netloc.replace(":", "_"), *path.split("/"))
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from cpc_types import CachedMossReport
+
+MOSS_CACHE_DIR = os.path.join("cache", "moss")
+
+# Moss deletes its results after 14 days, after that the cached URL is useless so the whole entry goes away
+MOSS_RESULT_LIFETIME_SECS = 14 * 24 * 60 * 60
+
+
+def get_cache_key(file_paths: Tuple[str, ...], language: str, options: Dict[str, Union[str, int]]) -> str:
+    """
+    Hashes everything Moss gets to see: the sorted file paths with the hash of their contents, the language and the
+    options. Any new, removed or modified file produces a different key.
+    """
+    files = []
+    for file_path in sorted(file_paths):
+        with open(file_path, "rb") as f:
+            files.append([file_path, hashlib.sha256(f.read()).hexdigest()])
+    payload = json.dumps({"files": files, "language": language, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_cached_report(key: str) -> Optional[CachedMossReport]:
+    entry_path = _get_entry_path(key)
+    if not os.path.exists(entry_path):
+        return None
+
+    with open(entry_path) as f:
+        entry = json.load(f)
+    if time.time() - entry["created_at"] > MOSS_RESULT_LIFETIME_SECS:
+        os.remove(entry_path)
+        return None
+    return CachedMossReport(url=entry["url"], created_at=entry["created_at"], unfiltered_html=entry["unfiltered_html"])
+
+
+def save_report(key: str, url: str, unfiltered_html: str) -> None:
+    os.makedirs(MOSS_CACHE_DIR, exist_ok=True)
+    entry = CachedMossReport(
+        url=url,
+        created_at=time.time(),
+        unfiltered_html=unfiltered_html,
+    )
+    # Write to a temporary file first so an interrupted run never leaves a truncated entry behind
+    entry_path = _get_entry_path(key)
+    tmp_path = f"{entry_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry.__dict__, f)
+    os.replace(tmp_path, entry_path)
+
+
+def evict_expired() -> int:
+    """
+    Removes the entries whose Moss results already expired, returns how many were removed.
+    """
+    if not os.path.isdir(MOSS_CACHE_DIR):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for file_name in os.listdir(MOSS_CACHE_DIR):
+        entry_path = os.path.join(MOSS_CACHE_DIR, file_name)
+        if not file_name.endswith(".json"):
+            continue
+        with open(entry_path) as f:
+            created_at = json.load(f)["created_at"]
+        if now - created_at > MOSS_RESULT_LIFETIME_SECS:
+            os.remove(entry_path)
+            removed += 1
+    return removed
+
+
+def _get_entry_path(key: str) -> str:
+    return os.path.join(MOSS_CACHE_DIR, f"{key}.json")
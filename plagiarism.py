@@ -1,81 +1,566 @@
+import dataclasses
+import glob
+import hashlib
+import html
+import itertools
+import math
 import os
-from typing import Dict, Tuple, List, Set
+import re
+import socket
+import time
+import urllib.error
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Tuple, List, Set, Optional, Iterator
 
 import mosspy
-from bs4 import BeautifulSoup
 
+from checkpoint import Checkpoint
 from terminal import with_color, BColor
-from cpc_types import MossHtml, Plagiarism
-from util import get_school_name
+from cpc_types import MossHtml, Plagiarism, MossJob
+from fingerprint import fingerprint, find_matches, tokenize
+import moss_cache
+from tracing import TRACER
+from util import get_school_name, with_retries, LANG_EXTENSION_TO_MOSS
 
-LANG_EXTENSION_TO_MOSS = {
-    ".c": "c",
-    ".cpp": "cc",
-    ".cs": "csharp#",
-    ".py": "python",
-    ".java": "java",
-    ".pascal": "pascal",
-    ".txt": "ascii",
-}
+# Larger jobs take Moss hours or time out, so their files are split into overlapping shards of at most this size
+MOSS_MAX_FILES_PER_JOB = 1000
+
+MOSS_TRIES = 3
+MOSS_BACKOFF_SECS = 30
+
+# Windows of this many consecutive non-blank lines found in the solutions of at least this fraction of the users are
+# treated as boilerplate, like a fast I/O template or a snippet from the statement
+BOILERPLATE_WINDOW_LINES = 3
+BOILERPLATE_MIN_USERS_FRAC = 0.5
+# Below this many users the fraction would flag code that just happens to be written the same way
+BOILERPLATE_MIN_USERS = 5
+
+_MOSS_LINK_REGEX = re.compile(r'<A HREF="([^"]*)">([^<]*)</A>', re.IGNORECASE)
 
 
 def check_plagiarism(
         moss_user_id: str,
-        problem_aliases: List[str],
+        run_times_by_problem: Dict[str, Dict[str, datetime]],
         min_plagiarism_perc: int,
         name_by_username: Dict[str, str],
         check_diff_schools: bool,
+        engine: str = "moss",
+        moss_workers: int = 4,
+        use_moss_cache: bool = True,
+        max_runs_per_user: Optional[int] = None,
+        moss_max_files: int = MOSS_MAX_FILES_PER_JOB,
+        checkpoint: Optional[Checkpoint] = None,
 ) -> List[Plagiarism]:
-    print("Sending information to Moss. Please be patient...")
-    os.makedirs("submission", exist_ok=True)
-    moss_htmls = []
-    for problem_alias in problem_aliases:
-        for ext, moss_lang in LANG_EXTENSION_TO_MOSS.items():
-            m = mosspy.Moss(moss_user_id, moss_lang)
-            m.addFilesByWildcard(os.path.join("generated", problem_alias, "*", f"*{ext}"))
-            if len(m.files) == 0:
-                continue
+    plagiarism_check = PlagiarismCheck(
+        moss_user_id,
+        min_plagiarism_perc,
+        name_by_username,
+        check_diff_schools,
+        engine,
+        moss_workers,
+        use_moss_cache,
+        max_runs_per_user,
+        moss_max_files,
+        checkpoint,
+    )
+    with plagiarism_check:
+        for problem_alias, run_times in run_times_by_problem.items():
+            plagiarism_check.submit(problem_alias, run_times)
+        return plagiarism_check.wait()
 
-            print()
-            print(with_color(f"Analyzing {len(m.files)} solutions in {moss_lang} ({ext}) for problem {problem_alias}", BColor.OK_GREEN))
 
-            url = m.send(lambda file_path, display_name: print("*", end="", flush=True))
-            print()
-            if url.startswith("Error:"):
-                print(f"Got an error from Moss: {with_color(url, BColor.FAIL)}")
-                raise RuntimeError(f"Got an error from Moss: {url}")
+class PlagiarismCheck:
+    """
+    Compares the solutions of each problem in background threads as soon as the problem is submitted, so the
+    comparison of a problem overlaps with downloading and analyzing the next ones. Used as a context manager, or with
+    `close` called when the check stops, so the jobs still queued are dropped instead of running until exit.
+    """
 
-            print(f"Unfiltered Online Report (May contain duplicates): {with_color(url, BColor.OK_CYAN)}")
+    def __init__(
+            self,
+            moss_user_id: str,
+            min_plagiarism_perc: int,
+            name_by_username: Dict[str, str],
+            check_diff_schools: bool,
+            engine: str = "moss",
+            moss_workers: int = 4,
+            use_moss_cache: bool = True,
+            max_runs_per_user: Optional[int] = None,
+            moss_max_files: int = MOSS_MAX_FILES_PER_JOB,
+            checkpoint: Optional[Checkpoint] = None,
+    ) -> None:
+        self.moss_user_id = moss_user_id
+        self.min_plagiarism_perc = min_plagiarism_perc
+        self.name_by_username = name_by_username
+        self.check_diff_schools = check_diff_schools
+        self.engine = engine
+        self.moss_workers = moss_workers
+        self.use_moss_cache = use_moss_cache
+        self.max_runs_per_user = max_runs_per_user
+        self.moss_max_files = moss_max_files
+        self.checkpoint = checkpoint
+        # Each future is paired with its problem and language, the results of the shards of a job are merged
+        self._futures: List[Tuple[Tuple[str, str], Future]] = []
 
-            # Save report file
-            report_path = os.path.join(
-                "submission", f"{problem_alias}_{moss_lang}_unfiltered_report.html"
-            )
-            filtered_report_path = os.path.join(
-                "submission", f"{problem_alias}_{moss_lang}_filtered_report.html"
-            )
-            print("The unfiltered report has been saved locally inside: ", report_path)
-            m.saveWebPage(url, report_path)
+        os.makedirs("submission", exist_ok=True)
+        if engine == "local":
+            print("Comparing the solutions locally...")
+            # The local engine is CPU bound, more threads would only fight for the GIL
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            if use_moss_cache:
+                evicted = moss_cache.evict_expired()
+                if evicted:
+                    print(f"Removed {evicted} cached Moss reports that already expired")
+            self._executor = ThreadPoolExecutor(max_workers=moss_workers)
 
-            _remove_same_user_matches(report_path, filtered_report_path, problem_alias)
-            moss_htmls.append(MossHtml(
-                problem_alias=problem_alias,
-                language=moss_lang,
-                html_path=filtered_report_path,
-            ))
+    def submit(self, problem_alias: str, run_times: Dict[str, datetime]) -> None:
+        """
+        Queues the comparison of every language of the problem, the files of its runs must already be written. Only
+        the files of the given runs are compared, their submission times tell which is the latest run of each user.
+        """
+        jobs = get_moss_jobs(problem_alias, run_times, self.max_runs_per_user)
+        if self.engine == "local":
+            for job in jobs:
+                self._futures.append(((job.problem_alias, job.language), self._executor.submit(self._check_job, job)))
+            return
 
-    plagiarisms: List[Plagiarism] = []
-    for moss_html in moss_htmls:
-        lang_plagiarisms = sorted(
-            _get_information_from_html(moss_html, name_by_username),
-            key=lambda p: -p.similarity_perc,
+        # The boilerplate is only for Moss, the local engine already ignores the fingerprints found in many files
+        jobs = [
+            shard
+            for job in jobs
+            for shard in _split_job_into_shards(_add_boilerplate_file(job), self.moss_max_files)
+        ]
+        print(f"Sending {len(jobs)} jobs of problem {problem_alias} to Moss, {self.moss_workers} at a time...")
+        for job in jobs:
+            self._futures.append(((job.problem_alias, job.language), self._executor.submit(self._check_job, job)))
+
+    def _check_job(self, job: MossJob) -> List[Plagiarism]:
+        """
+        Compares the files of the job, unless they were already compared by the check being resumed.
+        """
+        unit = _get_checkpoint_unit(job) if self.checkpoint else None
+        if unit:
+            checkpointed_plagiarisms = self.checkpoint.get(unit)
+            if checkpointed_plagiarisms is not None:
+                job_name = _get_job_name(job.problem_alias, job.language, job.shard_idx)
+                print(f"Reusing the results of {job_name} from the interrupted check")
+                return [Plagiarism.from_dict(plag) for plag in checkpointed_plagiarisms]
+
+        if self.engine == "local":
+            plagiarisms = _check_job_locally(job, self.min_plagiarism_perc, self.name_by_username)
+        else:
+            plagiarisms = _check_job_with_moss(self.moss_user_id, job, self.use_moss_cache, self.name_by_username)
+        if unit:
+            self.checkpoint.save(unit, [dataclasses.asdict(plag) for plag in plagiarisms])
+        return plagiarisms
+
+    def wait(self) -> List[Plagiarism]:
+        """
+        Waits for all the submitted problems and returns the plagiarisms found, in the order they were submitted.
+        """
+        if self.engine != "local" and any(not future.done() for _, future in self._futures):
+            print("Waiting for the Moss results. Please be patient...")
+        plagiarisms_by_job: Dict[Tuple[str, str], List[Plagiarism]] = {}
+        try:
+            for job_key, future in self._futures:
+                # The shards overlap, the pairs they share are deduplicated when the plagiarisms are selected
+                plagiarisms_by_job.setdefault(job_key, []).extend(future.result())
+        finally:
+            self.close()
+        return _select_plagiarisms(
+            list(plagiarisms_by_job.values()), self.min_plagiarism_perc, self.check_diff_schools
+        )
+
+    def close(self) -> None:
+        """
+        Drops the jobs that didn't start yet, without waiting for the running ones, which can't be interrupted.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "PlagiarismCheck":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _check_job_with_moss(
+        moss_user_id: str,
+        job: MossJob,
+        use_cache: bool,
+        name_by_username: Dict[str, str],
+) -> List[Plagiarism]:
+    moss_html = _run_moss_job_with_retries(moss_user_id, job, use_cache)
+    return list(parse_moss_report(moss_html, name_by_username))
+
+
+def get_moss_jobs(
+        problem_alias: str,
+        run_times: Dict[str, datetime],
+        max_runs_per_user: Optional[int] = None,
+) -> List[MossJob]:
+    """
+    Makes a job for every language with files of the given runs, which are mapped to their submission times.
+    """
+    jobs = []
+    for ext, moss_lang in LANG_EXTENSION_TO_MOSS.items():
+        # Previous checks may have left the files of other runs, like the ones of other contests or teams
+        file_paths = [
+            file_path
+            for file_path in sorted(glob.glob(os.path.join("generated", problem_alias, "*", f"*{ext}")))
+            if get_run_id_from_file_path(file_path) in run_times
+        ]
+        if not file_paths:
+            continue
+
+        representative_file_paths = _select_representative_files(
+            file_paths, run_times, moss_lang, max_runs_per_user
+        )
+        pruned = len(file_paths) - len(representative_file_paths)
+        if pruned:
+            print(f"Pruned {pruned} of {len(file_paths)} {moss_lang} solutions for problem {problem_alias} that don't "
+                  f"need to be compared")
+        jobs.append(MossJob(
+            problem_alias=problem_alias,
+            language=moss_lang,
+            file_paths=tuple(representative_file_paths),
+        ))
+    return jobs
+
+
+def _select_representative_files(
+        file_paths: List[str],
+        run_times: Dict[str, datetime],
+        moss_lang: str,
+        max_runs_per_user: Optional[int],
+) -> List[str]:
+    """
+    Collapses the runs of each user to the ones worth comparing with other users. Runs whose normalized source is the
+    same as a later run of the same user are dropped, since they would produce the exact same matches. When there is
+    a limit of runs per user, the latest and the best scored runs are always kept, followed by the most recent ones.
+    """
+    file_paths_by_user: Dict[str, List[str]] = {}
+    for file_path in file_paths:
+        file_paths_by_user.setdefault(get_user_from_file_path(file_path), []).append(file_path)
+
+    representative_file_paths = []
+    for user_file_paths in file_paths_by_user.values():
+        # Newest go first
+        user_file_paths = sorted(
+            user_file_paths, key=lambda file_path: run_times[get_run_id_from_file_path(file_path)], reverse=True
+        )
+        seen_sources: Set[str] = set()
+        distinct_file_paths = []
+        for file_path in user_file_paths:
+            with open(file_path) as f:
+                tokens = tokenize(f.read(), moss_lang)
+            normalized_source = " ".join(token for token, _ in tokens)
+            if normalized_source not in seen_sources:
+                seen_sources.add(normalized_source)
+                distinct_file_paths.append(file_path)
+
+        if max_runs_per_user and len(distinct_file_paths) > max_runs_per_user:
+            latest = distinct_file_paths[0]
+            best_scored = max(distinct_file_paths, key=_get_score_from_file_path)
+            kept = [latest] if latest == best_scored else [latest, best_scored]
+            for file_path in distinct_file_paths:
+                if len(kept) >= max_runs_per_user:
+                    break
+                if file_path not in kept:
+                    kept.append(file_path)
+            distinct_file_paths = kept
+        representative_file_paths.extend(distinct_file_paths)
+
+    return sorted(representative_file_paths)
+
+
+def get_run_id_from_file_path(file_path: str) -> str:
+    # Files are named <guid>_<user>_<problem>_<verdict>_<score><ext>
+    return os.path.basename(file_path).split("_", 1)[0]
+
+
+def _get_score_from_file_path(file_path: str) -> int:
+    # Files are named <guid>_<user>_<problem>_<verdict>_<score><ext>
+    file_name, _ = os.path.splitext(os.path.basename(file_path))
+    return int(file_name.rsplit("_", 1)[1])
+
+
+def _split_job_into_shards(job: MossJob, max_files: int) -> List[MossJob]:
+    """
+    Splits the files of a job that is too large into blocks of half the maximum size, and makes a shard for every
+    pair of blocks, so every pair of files is still compared in some shard. The files are sorted by user, which keeps
+    the runs of a user together.
+    """
+    if len(job.file_paths) <= max_files:
+        return [job]
+
+    block_size = max(max_files // 2, 1)
+    blocks = [job.file_paths[idx:idx + block_size] for idx in range(0, len(job.file_paths), block_size)]
+    shards = [
+        dataclasses.replace(job, file_paths=block_1 + block_2, shard_idx=shard_idx)
+        for shard_idx, (block_1, block_2) in enumerate(itertools.combinations(blocks, 2))
+    ]
+    print(f"Splitting the {len(job.file_paths)} {job.language} solutions for problem {job.problem_alias} into "
+          f"{len(shards)} overlapping Moss jobs of at most {2 * block_size} files")
+    return shards
+
+
+def _get_checkpoint_unit(job: MossJob) -> str:
+    # The same job compares the same files, the paths include the guid of each run
+    files_hash = hashlib.sha256("\n".join(job.base_file_paths + job.file_paths).encode()).hexdigest()[:16]
+    return f"plagiarism:{job.problem_alias}:{job.language}:{job.shard_idx}:{files_hash}"
+
+
+def _get_job_name(problem_alias: str, language: str, shard_idx: Optional[int]) -> str:
+    return f"{problem_alias} ({language})" if shard_idx is None else f"{problem_alias} ({language}, shard {shard_idx})"
+
+
+def _add_boilerplate_file(job: MossJob) -> MossJob:
+    """
+    Finds the code shared by most of the users in the job and saves it as the base file of the job, so Moss doesn't
+    report it as matches. Returns the job unchanged when there is no boilerplate.
+    """
+    fragments = _find_boilerplate(job.file_paths)
+    if not fragments:
+        return job
+
+    _, ext = os.path.splitext(job.file_paths[0])
+    base_file_path = os.path.join("submission", f"{job.problem_alias}_{job.language}_base{ext}")
+    with open(base_file_path, "w") as f:
+        f.write("\n\n".join(fragments) + "\n")
+    line_count = sum(len(fragment.split("\n")) for fragment in fragments)
+    print(f"Found {line_count} lines of boilerplate in the {job.language} solutions for problem {job.problem_alias}, "
+          f"they were saved inside: {base_file_path}")
+    return dataclasses.replace(job, base_file_paths=(base_file_path,))
+
+
+def _find_boilerplate(file_paths: Tuple[str, ...]) -> List[str]:
+    """
+    Counts how many users have each window of consecutive lines, ignoring indentation and blank lines, and returns
+    the fragments made by the windows that most users have, as they were written in the first file that has them.
+    """
+    users_by_file_path = {file_path: get_user_from_file_path(file_path) for file_path in file_paths}
+    user_count = len(set(users_by_file_path.values()))
+    min_users = max(BOILERPLATE_MIN_USERS, math.ceil(user_count * BOILERPLATE_MIN_USERS_FRAC))
+    if user_count < min_users:
+        return []
+
+    users_by_window: Dict[int, Set[str]] = {}
+    first_window_by_hash: Dict[int, Tuple[str, int]] = {}
+    for file_path in file_paths:
+        lines = _read_non_blank_lines(file_path)
+        for idx in range(len(lines) - BOILERPLATE_WINDOW_LINES + 1):
+            window_hash = hash(tuple(line.strip() for line in lines[idx:idx + BOILERPLATE_WINDOW_LINES]))
+            users_by_window.setdefault(window_hash, set()).add(users_by_file_path[file_path])
+            first_window_by_hash.setdefault(window_hash, (file_path, idx))
+
+    window_idxs_by_file_path: Dict[str, List[int]] = {}
+    for window_hash, users in users_by_window.items():
+        if len(users) >= min_users:
+            file_path, idx = first_window_by_hash[window_hash]
+            window_idxs_by_file_path.setdefault(file_path, []).append(idx)
+
+    fragments = []
+    for file_path, window_idxs in window_idxs_by_file_path.items():
+        lines = _read_non_blank_lines(file_path)
+        # Overlapping or adjacent windows are joined into a single fragment
+        window_idxs.sort()
+        start = end = window_idxs[0]
+        for idx in window_idxs[1:] + [math.inf]:
+            if idx > end + BOILERPLATE_WINDOW_LINES:
+                fragments.append("\n".join(lines[start:end + BOILERPLATE_WINDOW_LINES]))
+                start = idx
+            end = idx
+    return list(dict.fromkeys(fragments))
+
+
+def _read_non_blank_lines(file_path: str) -> List[str]:
+    with open(file_path) as f:
+        return [line.rstrip() for line in f if line.strip()]
+
+
+def _run_moss_job_with_retries(moss_user_id: str, job: MossJob, use_cache: bool) -> MossHtml:
+    retries = 0
+
+    def on_retry(error: BaseException, wait_secs: float) -> None:
+        nonlocal retries
+        retries += 1
+        print(with_color(
+            f"Moss failed for {_get_job_name(job.problem_alias, job.language, job.shard_idx)}: {error}, "
+            f"retrying in {wait_secs:.0f} seconds...",
+            BColor.WARNING,
+        ))
+
+    start = time.time()
+    try:
+        moss_html, cached = with_retries(
+            lambda: _run_moss_job(moss_user_id, job, use_cache),
+            tries=MOSS_TRIES,
+            backoff_secs=MOSS_BACKOFF_SECS,
+            retry_on=(ConnectionError, socket.timeout, urllib.error.URLError),
+            on_retry=on_retry,
+        )
+    except (ConnectionError, socket.timeout, urllib.error.URLError):
+        print(with_color(f"Error talking to Moss after {MOSS_TRIES} tries", BColor.FAIL))
+        raise
+
+    TRACER.record(
+        "moss",
+        _get_job_name(job.problem_alias, job.language, job.shard_idx),
+        time.time() - start,
+        bytes_sent=0 if cached else sum(
+            os.path.getsize(file_path) for file_path in job.base_file_paths + job.file_paths
+        ),
+        bytes_received=os.path.getsize(moss_html.html_path),
+        retries=retries,
+        files=len(job.file_paths),
+        cached=cached,
+    )
+    return moss_html
+
+
+def _run_moss_job(moss_user_id: str, job: MossJob, use_cache: bool) -> Tuple[MossHtml, bool]:
+    """
+    Sends the job to Moss and saves its report, returns where the report was saved and whether it came from the cache.
+    """
+    m = mosspy.Moss(moss_user_id, job.language)
+    for file_path in job.base_file_paths:
+        m.addBaseFile(file_path)
+    for file_path in job.file_paths:
+        m.addFile(file_path)
+
+    job_name = _get_job_name(job.problem_alias, job.language, job.shard_idx)
+    report_path = _get_report_path(job.problem_alias, job.language, "unfiltered", job.shard_idx)
+    moss_html = MossHtml(
+        problem_alias=job.problem_alias,
+        language=job.language,
+        html_path=report_path,
+        shard_idx=job.shard_idx,
+    )
+
+    cache_key = (
+        moss_cache.get_cache_key(job.base_file_paths + job.file_paths, job.language, m.options) if use_cache else None
+    )
+    cached_report = moss_cache.get_cached_report(cache_key) if cache_key else None
+    if cached_report:
+        print(f"No changes for {job_name} since the last check, reusing {with_color(cached_report.url, BColor.OK_CYAN)}")
+        with open(report_path, "w") as f:
+            f.write(cached_report.unfiltered_html)
+        return moss_html, True
+
+    print(with_color(f"Analyzing {len(m.files)} solutions in {job.language} for problem {job.problem_alias}", BColor.OK_GREEN))
+    url = m.send()
+    if url.startswith("Error:"):
+        print(f"Got an error from Moss: {with_color(url, BColor.FAIL)}")
+        raise RuntimeError(f"Got an error from Moss: {url}")
+
+    print(f"Unfiltered Online Report for {job_name} (May contain duplicates): {with_color(url, BColor.OK_CYAN)}")
+
+    # Save report file
+    print("The unfiltered report has been saved locally inside: ", report_path)
+    m.saveWebPage(url, report_path)
+
+    if cache_key:
+        with open(report_path) as f:
+            moss_cache.save_report(cache_key, url, f.read())
+    return moss_html, False
+
+
+def _get_report_path(problem_alias: str, language: str, kind: str, shard_idx: Optional[int] = None) -> str:
+    shard = "" if shard_idx is None else f"_shard{shard_idx}"
+    return os.path.join("submission", f"{problem_alias}_{language}{shard}_{kind}_report.html")
+
+
+def _check_job_locally(
+        job: MossJob,
+        min_plagiarism_perc: int,
+        name_by_username: Dict[str, str],
+) -> List[Plagiarism]:
+    problem_alias, moss_lang = job.problem_alias, job.language
+    print(with_color(f"Analyzing {len(job.file_paths)} solutions in {moss_lang} for problem {problem_alias}", BColor.OK_GREEN))
+    fingerprints = []
+    for file_path in job.file_paths:
+        with open(file_path) as f:
+            fingerprints.append(fingerprint(file_path, f.read(), moss_lang))
+
+    matches_dir = os.path.join("submission", f"{problem_alias}_{moss_lang}_local")
+    os.makedirs(matches_dir, exist_ok=True)
+    plagiarisms = []
+    for match in find_matches(fingerprints, min_plagiarism_perc):
+        # Show the file with the highest similarity first, like Moss shows it in its own column
+        order = (0, 1) if match.similarity_percs[0] >= match.similarity_percs[1] else (1, 0)
+        file_paths_pair = tuple(match.file_paths[i] for i in order)
+        usernames = tuple(get_user_from_file_path(path) for path in file_paths_pair)
+        if usernames[0] == usernames[1]:
+            continue
+
+        status = f"({match.similarity_percs[order[0]]}%)"
+        match_path = os.path.join(matches_dir, f"match{len(plagiarisms)}.html")
+        _write_local_match_page(
+            match_path,
+            file_paths_pair,
+            tuple(match.similarity_percs[i] for i in order),
+            tuple(match.matched_lines[i] for i in order),
         )
+        plagiarisms.append(Plagiarism(
+            usernames=usernames,
+            names=(name_by_username.get(usernames[0]), name_by_username.get(usernames[1])),
+            results_url=match_path,
+            problem_alias=problem_alias,
+            language=moss_lang,
+            file_names=tuple(os.path.basename(path) for path in file_paths_pair),
+            status=status,
+            similarity_perc=_get_similarity_perc(status),
+        ))
+    print(f"Found {len(plagiarisms)} similar pairs, the details were saved inside: {matches_dir}")
+    return plagiarisms
+
+
+def get_user_from_file_path(file_path: str) -> str:
+    # Files are saved as generated/<problem>/<user>/<file>
+    return os.path.basename(os.path.dirname(file_path))
+
+
+def _write_local_match_page(
+        match_path: str,
+        file_paths: Tuple[str, str],
+        similarity_percs: Tuple[int, int],
+        matched_lines: Tuple[Set[int], Set[int]],
+) -> None:
+    columns = []
+    for file_path, perc, lines in zip(file_paths, similarity_percs, matched_lines):
+        with open(file_path) as f:
+            source_lines = f.read().split("\n")
+        rendered_lines = [
+            f'<span style="background: #ffd6d6">{html.escape(line)}</span>' if idx in lines else html.escape(line)
+            for idx, line in enumerate(source_lines)
+        ]
+        columns.append(
+            f"<td valign=top><b>{html.escape(file_path)} ({perc}%)</b><pre>" + "\n".join(rendered_lines) + "</pre></td>"
+        )
+
+    with open(match_path, "w") as f:
+        f.write("<html><head><meta charset=\"UTF-8\"><title>Local match</title></head><body><table><tr>")
+        f.write("".join(columns))
+        f.write("</tr></table></body></html>")
+
+
+def _select_plagiarisms(
+        lang_plagiarisms: List[List[Plagiarism]],
+        min_plagiarism_perc: int,
+        check_diff_schools: bool,
+) -> List[Plagiarism]:
+    plagiarisms: List[Plagiarism] = []
+    for job_plagiarisms in lang_plagiarisms:
         seen_pairs: Set[Tuple[str, str]] = set()
-        for plag in lang_plagiarisms:
-            if plag.usernames in seen_pairs:
+        for plag in sorted(job_plagiarisms, key=lambda p: -p.similarity_perc):
+            pair = tuple(sorted(plag.usernames))
+            if pair in seen_pairs:
                 # Only keep the first plagiarism finding for each pair, as it's the most similar
                 continue
-            seen_pairs.add(plag.usernames)
+            seen_pairs.add(pair)
 
             if not check_diff_schools:
                 school_1 = get_school_name(plag.names[0])
@@ -90,80 +575,50 @@ def check_plagiarism(
     return sorted(plagiarisms, key=lambda p: -p.similarity_perc)
 
 
-def _remove_same_user_matches(report_path: str, filtered_report_path: str, problem_alias: str) -> None:
-    with open(report_path, "r") as f:
-        lines = f.readlines()
-
-    with open(filtered_report_path, "w") as f:
-        idx = 0
-        while idx < len(lines) - 2:
-            line = lines[idx]
-            next_line = lines[idx + 1]
-            if line.startswith("<TR><TD>"):
-                first_line_user = _get_user_from_html_line(line, problem_alias)
-                second_line_user = _get_user_from_html_line(next_line, problem_alias)
-                if first_line_user != second_line_user:
-                    f.write(line)
-                    f.write(next_line)
-                    f.write(lines[idx + 2])  # align table line
-                idx += 2
-            else:
-                f.write(line)
-            idx += 1
-    print(f"--- The filtered report has been saved locally inside: {filtered_report_path}")
-
+def _get_similarity_perc(status: str) -> int:
+    return int(status.replace("(", "").replace(")", "").replace("%", ""))
 
-def _get_user_from_html_line(line: str, problem_alias: str) -> str:
-    search_index = line.index(problem_alias) + len(problem_alias) + 1
-    # Now find the user
-    user_index = line.index("/", search_index)
-    return line[search_index:user_index]
 
+def parse_moss_report(moss_html: MossHtml, name_by_username: Dict[str, str]) -> Iterator[Plagiarism]:
+    """
+    Reads the Moss report line by line, only once, yielding every match between different users. At the same time it
+    writes the filtered report, which is the same report without the matches of a user with themselves.
+    """
+    filtered_report_path = _get_report_path(
+        moss_html.problem_alias, moss_html.language, "filtered", moss_html.shard_idx
+    )
+    with open(moss_html.html_path) as report, open(filtered_report_path, "w") as filtered_report:
+        for line in report:
+            if not line.upper().startswith("<TR><TD>"):
+                filtered_report.write(line)
+                continue
 
-def _get_similarity_perc(status: str) -> int:
-    return int(status.replace("(", "").replace(")", "").replace("%", ""))
+            # Each match takes three lines: one per file and the number of lines matched
+            pair_line = next(report, "")
+            lines_matched_line = next(report, "")
+            first_link = _MOSS_LINK_REGEX.search(line)
+            second_link = _MOSS_LINK_REGEX.search(pair_line)
+            if not first_link or not second_link or "results" not in first_link.group(1):
+                filtered_report.writelines((line, pair_line, lines_matched_line))
+                continue
 
+            problem_alias, username_1, file_name_1, status = _get_results_information(html.unescape(first_link.group(2)))
+            _, username_2, file_name_2, _ = _get_results_information(html.unescape(second_link.group(2)))
+            if username_1 == username_2:
+                continue
 
-def _get_information_from_html(moss_html: MossHtml, name_by_username: Dict[str, str]) -> List[Plagiarism]:
-    results: List[Plagiarism] = []
-    with open(moss_html.html_path) as h:
-        scrapper = BeautifulSoup(h, "html.parser")
-        a_tags = scrapper.find_all("a")
-
-        # TODO: group by two
-        for idx in range(0, len(a_tags), 2):
-            tag = a_tags[idx]
-            tag_pair = a_tags[idx + 1]
-
-            if "results" in str(tag) and "results" in str(tag_pair):  # filter out the results
-                url = tag.get("href")
-
-                # Process first tag
-                first_tag_information = tag.contents[0]
-                problem_alias, username_1, file_name_1, status = _get_results_information(
-                    first_tag_information
-                )
-                name_1 = name_by_username.get(username_1)
-
-                # Process second tag
-                second_tag_information = tag_pair.contents[0]
-                _, username_2, file_name_2, _ = _get_results_information(
-                    second_tag_information
-                )
-                name_2 = name_by_username.get(username_2)
-
-                results.append(Plagiarism(
-                    usernames=(username_1, username_2),
-                    names=(name_1, name_2),
-                    results_url=url,
-                    problem_alias=problem_alias,
-                    language=moss_html.language,
-                    file_names=(file_name_1, file_name_2),
-                    status=status,
-                    similarity_perc=_get_similarity_perc(status),
-                ))
-
-    return results
+            filtered_report.writelines((line, pair_line, lines_matched_line))
+            yield Plagiarism(
+                usernames=(username_1, username_2),
+                names=(name_by_username.get(username_1), name_by_username.get(username_2)),
+                results_url=first_link.group(1),
+                problem_alias=problem_alias,
+                language=moss_html.language,
+                file_names=(file_name_1, file_name_2),
+                status=status,
+                similarity_perc=_get_similarity_perc(status),
+            )
+    print(f"--- The filtered report has been saved locally inside: {filtered_report_path}")
 
 
 def _get_results_information(information: str) -> Tuple[str, str, str, str]:
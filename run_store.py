@@ -0,0 +1,148 @@
+import dataclasses
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+
+from cpc_types import RunRecord, SuspiciousActivity, Plagiarism
+
+RUN_STORE_PATH = "runs.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    guid TEXT PRIMARY KEY,
+    contest_alias TEXT NOT NULL,
+    problem_alias TEXT NOT NULL,
+    username TEXT NOT NULL,
+    language TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    score REAL NOT NULL,
+    time REAL NOT NULL,
+    source_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_problem ON runs (contest_alias, problem_alias, time);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    contest_alias TEXT NOT NULL,
+    problem_alias TEXT NOT NULL,
+    options TEXT NOT NULL,
+    suspicious_activities TEXT NOT NULL,
+    plagiarisms TEXT NOT NULL,
+    PRIMARY KEY (contest_alias, problem_alias)
+);
+"""
+
+
+class RunStore:
+    """
+    Local SQLite database with the runs that were already synced, the hash of their source and the analysis results
+    of each problem, so later checks only need to fetch and analyze what changed.
+    """
+
+    def __init__(self, db_path: str = RUN_STORE_PATH) -> None:
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def get_known_guids(self, contest_alias: str, problem_alias: str) -> Set[str]:
+        rows = self._db.execute(
+            "SELECT guid FROM runs WHERE contest_alias = ? AND problem_alias = ?",
+            (contest_alias, problem_alias),
+        )
+        return {guid for guid, in rows}
+
+    def add_runs(self, contest_alias: str, problem_alias: str, runs: List[RunRecord]) -> None:
+        """
+        Stores the new runs of the problem. Its stored analysis doesn't include them, so it's dropped in the same
+        transaction, and a check that stops before saving the new analysis doesn't leave the old one behind.
+        """
+        if not runs:
+            return
+        with self._db:
+            self._db.execute(
+                "DELETE FROM analyses WHERE contest_alias = ? AND problem_alias = ?",
+                (contest_alias, problem_alias),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO runs "
+                "(guid, contest_alias, problem_alias, username, language, verdict, score, time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run.guid, contest_alias, problem_alias, run.username, run.language, run.verdict, run.score,
+                        run.time.timestamp(),
+                    )
+                    for run in runs
+                ],
+            )
+
+    def get_runs_by_username(self, contest_alias: str, problem_alias: str) -> Dict[str, List[RunRecord]]:
+        rows = self._db.execute(
+            "SELECT guid, username, language, verdict, score, time FROM runs "
+            "WHERE contest_alias = ? AND problem_alias = ? ORDER BY time",
+            (contest_alias, problem_alias),
+        )
+        runs_by_username: Dict[str, List[RunRecord]] = {}
+        for guid, username, language, verdict, score, timestamp in rows:
+            runs_by_username.setdefault(username, []).append(RunRecord(
+                guid=guid,
+                username=username,
+                language=language,
+                verdict=verdict,
+                score=score,
+                time=datetime.fromtimestamp(timestamp),
+            ))
+        return runs_by_username
+
+    def set_source_hashes(self, source_hash_by_run_id: Dict[str, str]) -> None:
+        with self._db:
+            self._db.executemany(
+                "UPDATE runs SET source_hash = ? WHERE guid = ?",
+                [(source_hash, guid) for guid, source_hash in source_hash_by_run_id.items()],
+            )
+
+    def save_analysis(
+            self,
+            contest_alias: str,
+            problem_alias: str,
+            options: str,
+            suspicious_activities: List[SuspiciousActivity],
+            plagiarisms: List[Plagiarism],
+    ) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(contest_alias, problem_alias, options, suspicious_activities, plagiarisms) VALUES (?, ?, ?, ?, ?)",
+                (
+                    contest_alias,
+                    problem_alias,
+                    options,
+                    json.dumps([dataclasses.asdict(a) for a in suspicious_activities]),
+                    json.dumps([dataclasses.asdict(p) for p in plagiarisms]),
+                ),
+            )
+
+    def get_analysis(
+            self,
+            contest_alias: str,
+            problem_alias: str,
+            options: str,
+    ) -> Optional[Tuple[List[SuspiciousActivity], List[Plagiarism]]]:
+        """
+        Returns the analysis results of the problem, unless it was never analyzed or it was analyzed with different
+        options.
+        """
+        row = self._db.execute(
+            "SELECT suspicious_activities, plagiarisms FROM analyses "
+            "WHERE contest_alias = ? AND problem_alias = ? AND options = ?",
+            (contest_alias, problem_alias, options),
+        ).fetchone()
+        if not row:
+            return None
+
+        suspicious_activities = [SuspiciousActivity(**a) for a in json.loads(row[0])]
+        plagiarisms = [Plagiarism.from_dict(p) for p in json.loads(row[1])]
+        return suspicious_activities, plagiarisms
@@ -0,0 +1,393 @@
+import dataclasses
+import hmac
+import html
+import http.cookies
+import itertools
+import json
+import mimetypes
+import os
+import queue
+import secrets
+import threading
+import time
+import traceback
+import urllib.parse
+from contextlib import contextmanager, ExitStack
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Any
+
+from cpc_types import SuspiciousActivity, Plagiarism
+from terminal import with_color, BColor
+
+SERVICE_REPORTS_DIR = "service_reports"
+# Only this machine can reach the service unless another host is given, it serves the code of every contestant
+SERVICE_HOST = "127.0.0.1"
+_JSON_TYPE_NAMES = {bool: "boolean", int: "integer", float: "number", str: "string"}
+# Set by the first request that brings the token in its URL, so a browser can follow the links of the reports
+_TOKEN_COOKIE = "cpc_token"
+
+# Options of a check that the clients of the service can change for each job, the rest come from the command line
+JOB_OPTION_TYPES = {
+    "should_check_plagiarism": bool,
+    "min_plagiarism_perc": int,
+    "check_diff_schools": bool,
+    "plagiarism_engine": str,
+    "max_runs_per_user": int,
+    "check_history": bool,
+    "collusion_window_minutes": int,
+    "report_format": str,
+    "top_teams": int,
+    "min_problem_points": float,
+    "include_nearby_teams": bool,
+}
+# Options that only take one of these values, like in the command line
+JOB_OPTION_CHOICES = {
+    "plagiarism_engine": ("moss", "local"),
+    "report_format": ("html", "sharded"),
+}
+
+# Files of the working directory that the reports link to, they are served below the path of each job
+_SHARED_DIRS = ("submission", "generated", "moss_archive")
+
+
+@dataclass
+class CheckJob:
+    job_id: int
+    contest_aliases: List[str]
+    problem_alias: str
+    options: Dict[str, Any]
+    every_minutes: Optional[float] = None
+    status: str = "queued"
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    runs_count: int = 0
+    activities: List[SuspiciousActivity] = field(default_factory=list)
+    plagiarisms: List[Plagiarism] = field(default_factory=list)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "id": self.job_id,
+            "contests": self.contest_aliases,
+            "problem": self.problem_alias,
+            "options": self.options,
+            "every_minutes": self.every_minutes,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "runs_count": self.runs_count,
+            "activities_count": len(self.activities),
+            "plagiarisms_count": len(self.plagiarisms),
+        }
+
+
+class CheckService:
+    """
+    Runs the checks requested to the service in a fixed number of background workers. Checks of the same contest
+    never run at the same time, since they share its stored runs, and neither do checks of the same problem, since
+    they write the same files. A job can be repeated every some minutes to keep its results up to date as new runs
+    arrive.
+    """
+
+    def __init__(
+            self,
+            run_check: Callable[[CheckJob, str], Tuple[List[SuspiciousActivity], List[Plagiarism]]],
+            list_problems: Callable[[List[str]], List[str]],
+            workers: int,
+            reports_dir: str = SERVICE_REPORTS_DIR,
+    ) -> None:
+        self.reports_dir = reports_dir
+        self._run_check = run_check
+        self._list_problems = list_problems
+        self._queue: "queue.Queue[CheckJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, CheckJob] = {}
+        self._job_ids = itertools.count(1)
+        self._job_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(
+            self,
+            contest_aliases: List[str],
+            problem_alias: str = "all",
+            options: Optional[Dict[str, Any]] = None,
+            every_minutes: Optional[float] = None,
+    ) -> CheckJob:
+        job = CheckJob(next(self._job_ids), list(contest_aliases), problem_alias, options or {}, every_minutes)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._queue.put(job)
+        return job
+
+    def get_job(self, job_id: int) -> Optional[CheckJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_jobs(self) -> List[CheckJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get_report_dir(self, job: CheckJob) -> str:
+        return os.path.join(self.reports_dir, str(job.job_id))
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            report_dir = self.get_report_dir(job)
+            os.makedirs(report_dir, exist_ok=True)
+            try:
+                with self._lock_job(job):
+                    job.status, job.started_at, job.error = "running", time.time(), None
+                    activities, plagiarisms = self._run_check(job, report_dir)
+                job.activities, job.plagiarisms = activities, plagiarisms
+                job.runs_count += 1
+                job.status = "done"
+            except Exception as e:
+                # A failed check must not take down the service, the error is kept for the clients to see
+                traceback.print_exc()
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            job.finished_at = time.time()
+
+            print(with_color(f"Job {job.job_id} for {','.join(job.contest_aliases)} is {job.status}", BColor.OK_CYAN))
+            if job.every_minutes:
+                timer = threading.Timer(job.every_minutes * 60, self._requeue, args=(job,))
+                timer.daemon = True
+                timer.start()
+            self._queue.task_done()
+
+    @contextmanager
+    def _lock_job(self, job: CheckJob) -> Iterator[None]:
+        """
+        Holds the locks of the contests and of the problems of the job while it runs. Contests that share a problem
+        write its files to the same generated/ and submission/ paths, so their jobs have to wait for each other.
+        """
+        problem_aliases = self._list_problems(job.contest_aliases) if job.problem_alias == "all" \
+            else [job.problem_alias]
+        lock_keys = {("contest", alias) for alias in job.contest_aliases}
+        lock_keys.update(("problem", alias) for alias in problem_aliases)
+        with ExitStack() as stack:
+            # Locks are always taken in the same order, so two jobs sharing some of them can't wait for each other
+            for lock_key in sorted(lock_keys):
+                with self._lock:
+                    job_lock = self._job_locks.setdefault(lock_key, threading.Lock())
+                stack.enter_context(job_lock)
+            yield
+
+    def _requeue(self, job: CheckJob) -> None:
+        job.status = "queued"
+        self._queue.put(job)
+
+
+def serve(service: CheckService, port: int, host: str = SERVICE_HOST, token: Optional[str] = None) -> None:
+    """
+    Serves the service over HTTP until interrupted:
+      - POST /jobs queues a check, with a JSON body like {"contests": [...], "problem": "all", "every_minutes": 10}
+        plus any of the options in JOB_OPTION_TYPES.
+      - GET /jobs and GET /jobs/<id> return the status of the jobs as JSON.
+      - GET /jobs/<id>/activities and GET /jobs/<id>/plagiarisms return the last results of a job as JSON.
+      - GET /jobs/<id>/report shows the last plagiarism report of a job.
+
+    Every request must bring the token, in an "Authorization: Bearer <token>" header or in a `token` query parameter.
+    When none is given a random one is made, and printed with the URL of the service.
+    """
+    token = token or secrets.token_urlsafe(16)
+    server = ThreadingHTTPServer((host, port), _make_handler(service, token))
+    print(with_color(f"\nServing the checks at http://{host}:{port}/?token={token}", BColor.OK_GREEN))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _make_handler(service: CheckService, token: str) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        _set_token_cookie = False
+
+        def do_GET(self) -> None:
+            if not self._authorize():
+                return
+            parts = [urllib.parse.unquote(part) for part in urllib.parse.urlparse(self.path).path.split("/") if part]
+            if not parts:
+                self._send_index()
+            elif parts == ["jobs"]:
+                self._send_json([job.to_json() for job in service.get_jobs()])
+            elif parts[0] == "jobs" and len(parts) >= 2:
+                job = service.get_job(int(parts[1])) if parts[1].isdigit() else None
+                if not job:
+                    self._send_error(404, "Unknown job")
+                elif len(parts) == 2:
+                    self._send_json(job.to_json())
+                elif parts[2:] == ["activities"]:
+                    self._send_json([dataclasses.asdict(activity) for activity in job.activities])
+                elif parts[2:] == ["plagiarisms"]:
+                    self._send_json([dataclasses.asdict(plag) for plag in job.plagiarisms])
+                elif parts[2:] == ["report"]:
+                    report_dir = service.get_report_dir(job)
+                    if job.options.get("report_format") == "sharded" or not os.path.exists(
+                            os.path.join(report_dir, "plagiarism_report.html")):
+                        self._send_redirect(f"/jobs/{job.job_id}/plagiarism_report/index.html")
+                    else:
+                        self._send_file(report_dir, ["plagiarism_report.html"])
+                elif parts[2] in _SHARED_DIRS:
+                    # Each shared directory is its own root, the rest of the working directory has the credentials
+                    self._send_file(os.path.join(os.getcwd(), parts[2]), parts[3:])
+                else:
+                    self._send_file(service.get_report_dir(job), parts[2:])
+            else:
+                self._send_error(404, "Not found")
+
+        def do_POST(self) -> None:
+            if not self._authorize():
+                return
+            if urllib.parse.urlparse(self.path).path.rstrip("/") != "/jobs":
+                self._send_error(404, "Not found")
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                contest_aliases, problem_alias, options, every_minutes = _parse_job(body)
+            except ValueError as e:
+                self._send_error(400, f"Invalid job: {e}")
+                return
+
+            job = service.submit(contest_aliases, problem_alias, options, every_minutes)
+            self._send_json(job.to_json(), status=202)
+
+        def _authorize(self) -> bool:
+            # The checks run with the credentials of the admin, and the files include the code of every contestant
+            self._set_token_cookie = False
+            query_tokens = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).get("token", [])
+            if any(_is_token(query_token, token) for query_token in query_tokens):
+                self._set_token_cookie = True
+                return True
+
+            authorization = self.headers.get("Authorization", "")
+            if authorization.startswith("Bearer ") and _is_token(authorization[len("Bearer "):], token):
+                return True
+            try:
+                cookie = http.cookies.SimpleCookie(self.headers.get("Cookie", ""))
+            except http.cookies.CookieError:
+                cookie = http.cookies.SimpleCookie()
+            if _TOKEN_COOKIE in cookie and _is_token(cookie[_TOKEN_COOKIE].value, token):
+                return True
+
+            self._send_error(401, "Missing or invalid token")
+            return False
+
+        def _send_index(self) -> None:
+            rows = "".join(
+                f"<tr><td><a href=\"/jobs/{job.job_id}/report\">{job.job_id}</a></td>"
+                f"<td>{html.escape(', '.join(job.contest_aliases))}</td><td>{html.escape(job.problem_alias)}</td>"
+                f"<td>{job.status}</td><td>{len(job.activities)}</td><td>{len(job.plagiarisms)}</td>"
+                f"<td>{html.escape(job.error or '')}</td></tr>"
+                for job in service.get_jobs()
+            )
+            self._send(
+                200,
+                "text/html; charset=utf-8",
+                "<html><head><title>Plagiarism checks</title></head><body><h1>Plagiarism checks</h1><table>"
+                "<tr><th>Job</th><th>Contests</th><th>Problem</th><th>Status</th><th>Activities</th>"
+                f"<th>Plagiarisms</th><th>Error</th></tr>{rows}</table></body></html>".encode(),
+            )
+
+        def _send_file(self, root_dir: str, parts: List[str]) -> None:
+            root_dir = os.path.realpath(root_dir)
+            file_path = os.path.realpath(os.path.join(root_dir, *parts))
+            # Paths with ".." must not escape the served directory
+            if os.path.commonpath([root_dir, file_path]) != root_dir or not os.path.isfile(file_path):
+                self._send_error(404, "Not found")
+                return
+            with open(file_path, "rb") as f:
+                content = f.read()
+            content_type = mimetypes.guess_type(file_path)[0] or "text/plain"
+            if content_type.startswith("text/") or content_type.endswith("javascript"):
+                content_type += "; charset=utf-8"
+            self._send(200, content_type, content)
+
+        def _send_json(self, data: Any, status: int = 200) -> None:
+            self._send(status, "application/json", json.dumps(data).encode())
+
+        def _send_error(self, status: int, message: str) -> None:
+            self._send_json({"error": message}, status=status)
+
+        def _send_redirect(self, location: str) -> None:
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self._end_headers()
+
+        def _send(self, status: int, content_type: str, content: bytes) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            self._end_headers()
+            self.wfile.write(content)
+
+        def _end_headers(self) -> None:
+            if self._set_token_cookie:
+                self.send_header("Set-Cookie", f"{_TOKEN_COOKIE}={token}; Path=/; HttpOnly; SameSite=Strict")
+            self.end_headers()
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # The checks already print their progress, the requests would bury it
+            pass
+
+    return Handler
+
+
+def _parse_job(body: Any) -> Tuple[List[str], str, Dict[str, Any], Optional[float]]:
+    """
+    Reads the contests, the problem, the options and the repetition of a job from its JSON body. Raises a ValueError
+    for anything unexpected, instead of guessing what was meant.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("the body must be a JSON object")
+    unknown_names = set(body) - {"contests", "problem", "every_minutes"} - set(JOB_OPTION_TYPES)
+    if unknown_names:
+        raise ValueError(f"unknown options {', '.join(sorted(unknown_names))}")
+
+    contest_aliases = body.get("contests")
+    if isinstance(contest_aliases, str):
+        contest_aliases = [contest_aliases]
+    if not contest_aliases or not isinstance(contest_aliases, list) or \
+            not all(isinstance(alias, str) and alias for alias in contest_aliases):
+        raise ValueError("contests must be a contest alias or a list of them")
+    problem_alias = body.get("problem") or "all"
+    if not isinstance(problem_alias, str):
+        raise ValueError("problem must be a problem alias or 'all'")
+
+    options = {name: _parse_job_option(name, body[name]) for name in JOB_OPTION_TYPES if name in body}
+    every_minutes = body.get("every_minutes")
+    if every_minutes is not None:
+        every_minutes = _parse_job_option("every_minutes", every_minutes, float)
+        if every_minutes <= 0:
+            raise ValueError("every_minutes must be positive")
+    return contest_aliases, problem_alias, options, every_minutes
+
+
+def _parse_job_option(name: str, value: Any, option_type: Optional[type] = None) -> Any:
+    option_type = option_type or JOB_OPTION_TYPES[name]
+    # JSON booleans are numbers for Python, and the strings "true" or "false" are not booleans at all
+    if option_type is bool:
+        valid = isinstance(value, bool)
+    elif option_type is int:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    elif option_type is float:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, option_type)
+    if not valid:
+        raise ValueError(f"{name} must be a {_JSON_TYPE_NAMES[option_type]}, got {json.dumps(value)}")
+    if name in JOB_OPTION_CHOICES and value not in JOB_OPTION_CHOICES[name]:
+        raise ValueError(f"{name} must be one of {', '.join(JOB_OPTION_CHOICES[name])}, got {json.dumps(value)}")
+    return option_type(value)
+
+
+def _is_token(candidate: str, token: str) -> bool:
+    return hmac.compare_digest(candidate.encode(), token.encode())
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from typing import Dict, Optional
+
+SOURCE_STORE_DIR = os.path.join("cache", "sources")
+# Saved once the run files written by the versions before the store were imported into it
+_IMPORTED_MARKER = "imported_run_files"
+
+
+class SourceStore:
+    """
+    Content-addressed store for the source code of the runs. Every distinct source is saved once under its hash,
+    compressed unless disabled, and a manifest maps each run to the hash of its source. The manifest is loaded once,
+    so knowing whether a run was already downloaded doesn't touch the disk.
+    """
+
+    def __init__(self, store_dir: str = SOURCE_STORE_DIR, compress: bool = True) -> None:
+        self.store_dir = store_dir
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._hash_by_run_id: Dict[str, str] = {}
+        os.makedirs(os.path.join(store_dir, "objects"), exist_ok=True)
+        self._manifest_path = os.path.join(store_dir, "manifest.jsonl")
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._hash_by_run_id[entry["guid"]] = entry["hash"]
+
+    def __contains__(self, run_id: str) -> bool:
+        return run_id in self._hash_by_run_id
+
+    def get(self, run_id: str) -> Optional[str]:
+        object_path = self.get_object_path(run_id)
+        return read_source_object(object_path) if object_path else None
+
+    def get_hash(self, run_id: str) -> Optional[str]:
+        return self._hash_by_run_id.get(run_id)
+
+    def get_object_path(self, run_id: str) -> Optional[str]:
+        """
+        Returns where the source of the run is saved, so it can be read later, even from another process, with
+        read_source_object.
+        """
+        source_hash = self._hash_by_run_id.get(run_id)
+        if source_hash is None:
+            return None
+
+        object_path = self._get_object_path(source_hash)
+        return f"{object_path}.z" if os.path.exists(f"{object_path}.z") else object_path
+
+    def put(self, run_id: str, source: str) -> str:
+        """
+        Saves the source of the run, unless an identical source was already saved, and returns its hash.
+        """
+        data = source.encode()
+        source_hash = hashlib.sha256(data).hexdigest()
+        object_path = self._get_object_path(source_hash)
+        if not os.path.exists(object_path) and not os.path.exists(f"{object_path}.z"):
+            if self.compress:
+                object_path, data = f"{object_path}.z", zlib.compress(data)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            # Write to a temporary file first so an interrupted run never leaves a truncated object behind
+            tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, object_path)
+
+        with self._lock:
+            if self._hash_by_run_id.get(run_id) != source_hash:
+                self._hash_by_run_id[run_id] = source_hash
+                with open(self._manifest_path, "a") as f:
+                    f.write(json.dumps({"guid": run_id, "hash": source_hash}) + "\n")
+        return source_hash
+
+    def import_run_files(self, run_files_dir: str) -> int:
+        """
+        Saves the sources of the run files written before the store existed, named <guid>_<user>_..., so the first
+        check after upgrading doesn't download them again. It only happens once, later run files come from the store.
+        Returns how many sources were imported.
+        """
+        marker_path = os.path.join(self.store_dir, _IMPORTED_MARKER)
+        if os.path.exists(marker_path):
+            return 0
+
+        imported = 0
+        for dir_path, _, file_names in os.walk(run_files_dir):
+            for file_name in file_names:
+                run_id = file_name.split("_", 1)[0]
+                if "_" not in file_name or run_id in self:
+                    continue
+                with open(os.path.join(dir_path, file_name)) as f:
+                    source = f.read()
+                if source:
+                    self.put(run_id, source)
+                    imported += 1
+        with open(marker_path, "w"):
+            pass
+        return imported
+
+    def _get_object_path(self, source_hash: str) -> str:
+        return os.path.join(self.store_dir, "objects", source_hash[:2], source_hash)
+
+
+def read_source_object(object_path: str) -> str:
+    with open(object_path, "rb") as f:
+        data = f.read()
+    return (zlib.decompress(data) if object_path.endswith(".z") else data).decode()
@@ -1,4 +1,7 @@
-from typing import List, Optional
+import json
+import shutil
+from functools import lru_cache
+from typing import List, Optional, Iterable
 
 from pybars import Compiler
 import os
@@ -6,6 +9,14 @@ import os
 from cpc_types import Plagiarism
 from terminal import with_color, BColor
 
+# Rows per shard of the sharded report, small enough for the viewer to show the first page right away
+REPORT_SHARD_SIZE = 2000
+
+# Order of the values of each row of the sharded report, the viewer reads them by position
+REPORT_COLUMNS = [
+    "problem_alias", "language", "username_1", "username_2", "file_name_1", "file_name_2", "similarity_perc", "link",
+]
+
 
 def generate_html_report(plagiarisms: List[Plagiarism], file_path: str) -> None:
     print(with_color(f"\nGenerating plagiarism report at {file_path}", BColor.OK_CYAN))
@@ -24,12 +35,68 @@ def generate_html_report(plagiarisms: List[Plagiarism], file_path: str) -> None:
     for lang in sorted(results_by_lang.keys()):
         template_data.append({"lang": lang, "data": results_by_lang[lang]})
 
-    html_compiler = Compiler()
-    with open(os.path.join("template", "template.hbs"), "r") as t:
-        template = html_compiler.compile("".join(t.readlines()))
-        output = template({"results": template_data})
-        with open(file_path, "w") as o:
-            o.write(output)
+    output = _get_template()({"results": template_data})
+    with open(file_path, "w") as o:
+        o.write(output)
+
+
+def generate_sharded_report(
+        plagiarisms: Iterable[Plagiarism],
+        report_dir: str,
+        shard_size: int = REPORT_SHARD_SIZE,
+) -> None:
+    """
+    Writes the plagiarisms as compact shards of rows next to a static viewer that loads them one by one, and pages,
+    filters and sorts them in the browser. Each shard is a JSON array wrapped in a function call, so the viewer can
+    load it with a <script> tag even when opened from the disk, where browsers block reading JSON files.
+    """
+    index_path = os.path.join(report_dir, "index.html")
+    print(with_color(f"\nGenerating plagiarism report at {index_path}", BColor.OK_CYAN))
+    shards_dir = os.path.join(report_dir, "shards")
+    if os.path.isdir(shards_dir):
+        shutil.rmtree(shards_dir)
+    os.makedirs(shards_dir)
+
+    shard_count = 0
+    row_count = 0
+    rows = []
+
+    def write_shard() -> None:
+        nonlocal shard_count
+        with open(os.path.join(shards_dir, f"shard-{shard_count:05d}.js"), "w") as f:
+            f.write(f"addReportShard({json.dumps(rows, separators=(',', ':'))});\n")
+        shard_count += 1
+        rows.clear()
+
+    for plag in plagiarisms:
+        rows.append([
+            plag.problem_alias,
+            plag.language,
+            _get_display_name(plag.names[0], plag.usernames[0]),
+            _get_display_name(plag.names[1], plag.usernames[1]),
+            plag.file_names[0],
+            plag.file_names[1],
+            plag.similarity_perc,
+            # The viewer lives one level below the working directory
+            plag.results_url if "://" in plag.results_url else f"../{plag.results_url}",
+        ])
+        row_count += 1
+        if len(rows) == shard_size:
+            write_shard()
+    if rows:
+        write_shard()
+
+    with open(os.path.join(report_dir, "report_index.js"), "w") as f:
+        index = {"columns": REPORT_COLUMNS, "shards": shard_count, "rows": row_count}
+        f.write(f"setReportIndex({json.dumps(index)});\n")
+    shutil.copyfile(os.path.join(os.path.dirname(__file__), "viewer.html"), index_path)
+
+
+@lru_cache(maxsize=None)
+def _get_template():
+    # Compiling the template is slow, so it's only done once per process
+    with open(os.path.join(os.path.dirname(__file__), "template.hbs"), "r") as t:
+        return Compiler().compile(t.read())
 
 
 def _get_display_name(name: Optional[str], username: str) -> str:
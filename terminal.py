@@ -1,3 +1,4 @@
+import time
 from enum import Enum
 
 
@@ -15,3 +16,25 @@ class BColor(Enum):
 
 def with_color(text: str, color: BColor) -> str:
     return f"{color.value}{text}{BColor.END.value}"
+
+
+class Progress:
+    """
+    Prints a single, self-overwriting progress line with the throughput since it started.
+    """
+
+    def __init__(self, total: int, unit: str) -> None:
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self._start = time.monotonic()
+
+    def advance(self, count: int = 1) -> None:
+        self.done += count
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        rate = self.done / elapsed
+        print(f"\r  {self.done}/{self.total} {self.unit} ({rate:.1f} {self.unit}/s)", end="", flush=True)
+
+    def finish(self) -> None:
+        if self.done:
+            print()
@@ -0,0 +1,60 @@
+import http.client
+import os
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from service import CheckService, _make_handler
+
+TOKEN = "secret"
+
+
+class SharedDirsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._old_cwd = os.getcwd()
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp_dir.name)
+        with open("login.txt", "w") as f:
+            f.write("user\npassword\nmoss\n")
+        os.makedirs("generated")
+        with open(os.path.join("generated", "run.cpp"), "w") as f:
+            f.write("int main() {}\n")
+
+        service = CheckService(lambda job, report_dir: ([], []), lambda contest_aliases: [], workers=0)
+        service.submit(["contest"])
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(service, TOKEN))
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        os.chdir(self._old_cwd)
+        self._tmp_dir.cleanup()
+
+    def _get_status(self, path: str) -> int:
+        connection = http.client.HTTPConnection("127.0.0.1", self._server.server_address[1])
+        try:
+            connection.request("GET", path, headers={"Authorization": f"Bearer {TOKEN}"})
+            return connection.getresponse().status
+        finally:
+            connection.close()
+
+    def test_serves_files_of_shared_dir(self) -> None:
+        self.assertEqual(self._get_status("/jobs/1/generated/run.cpp"), 200)
+
+    def test_parent_dir_is_not_served(self) -> None:
+        self.assertEqual(self._get_status("/jobs/1/generated/../login.txt"), 404)
+        self.assertEqual(self._get_status("/jobs/1/generated/%2e%2e/login.txt"), 404)
+
+    def test_requires_token(self) -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", self._server.server_address[1])
+        try:
+            connection.request("GET", "/jobs/1/generated/run.cpp")
+            self.assertEqual(connection.getresponse().status, 401)
+        finally:
+            connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Optional
+
+from util import print_table
+
+
+class Tracer:
+    """
+    Records how long each stage of the check takes, together with every omegaUp API call and Moss job, so the time
+    of a slow check can be attributed. Nothing is recorded until it's enabled.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._start = time.time()
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._start = time.time()
+
+    @contextmanager
+    def stage(self, name: str, **attributes: Any) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record("stage", name, time.time() - start, start=start, **attributes)
+
+    def record(
+            self,
+            kind: str,
+            name: str,
+            secs: float,
+            bytes_sent: int = 0,
+            bytes_received: int = 0,
+            retries: int = 0,
+            start: Optional[float] = None,
+            **attributes: Any,
+    ) -> None:
+        if not self.enabled:
+            return
+
+        start = time.time() - secs if start is None else start
+        event = {
+            "kind": kind,
+            "name": name,
+            "start": round(start - self._start, 6),
+            "secs": round(secs, 6),
+            "bytes_sent": bytes_sent,
+            "bytes_received": bytes_received,
+            "retries": retries,
+            "thread": threading.current_thread().name,
+            **attributes,
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def get_summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregates the events by kind and name, in the order they first happened.
+        """
+        summary_by_key: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            events = list(self._events)
+        for event in events:
+            summary = summary_by_key.setdefault(f"{event['kind']}:{event['name']}", {
+                "kind": event["kind"],
+                "name": event["name"],
+                "calls": 0,
+                "secs": 0.0,
+                "max_secs": 0.0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "retries": 0,
+            })
+            summary["calls"] += 1
+            summary["secs"] += event["secs"]
+            summary["max_secs"] = max(summary["max_secs"], event["secs"])
+            summary["bytes_sent"] += event["bytes_sent"]
+            summary["bytes_received"] += event["bytes_received"]
+            summary["retries"] += event["retries"]
+        return list(summary_by_key.values())
+
+    def write_json(self, file_path: str) -> None:
+        with self._lock:
+            events = list(self._events)
+        with open(file_path, "w") as f:
+            json.dump({"summary": self.get_summary(), "events": events}, f, indent=2)
+
+    def print_summary(self) -> None:
+        rows = [["Kind", "Name", "Calls", "Seconds", "Max seconds", "KiB sent", "KiB received", "Retries"]]
+        for summary in self.get_summary():
+            rows.append([
+                summary["kind"],
+                summary["name"],
+                str(summary["calls"]),
+                f"{summary['secs']:.3f}",
+                f"{summary['max_secs']:.3f}",
+                f"{summary['bytes_sent'] / 1024:.1f}",
+                f"{summary['bytes_received'] / 1024:.1f}",
+                str(summary["retries"]),
+            ])
+        print_table(rows)
+
+
+TRACER = Tracer()
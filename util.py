@@ -1,5 +1,41 @@
 import os.path
-from typing import Tuple, List, Dict, Optional
+import random
+import time
+from typing import Tuple, List, Dict, Optional, Callable, Type, TypeVar
+
+T = TypeVar("T")
+
+OMEGAUP_LANG_EXTENSION = {
+    "c11-clang": ".c",
+    "c11-gcc": ".c",
+    "cpp11-clang": ".cpp",
+    "cpp11-gcc": ".cpp",
+    "cpp17-clang": ".cpp",
+    "cpp17-gcc": ".cpp",
+    "cpp20-clang": ".cpp",
+    "cpp20-gcc": ".cpp",
+    "cs": ".cs",
+    "java": ".java",
+    "kj": ".java",
+    "kp": ".pascal",
+    "py2": ".py",
+    "py3": ".py",
+}
+
+LANG_EXTENSION_TO_MOSS = {
+    ".c": "c",
+    ".cpp": "cc",
+    ".cs": "csharp#",
+    ".py": "python",
+    ".java": "java",
+    ".pascal": "pascal",
+    ".txt": "ascii",
+}
+
+
+def get_normalized_extension(lang: str) -> str:
+    extension = OMEGAUP_LANG_EXTENSION[lang]
+    return ".cpp" if extension == ".c" else extension
 
 
 def get_credentials_from_file(file_name: str) -> Tuple[str, str, str]:
@@ -43,3 +79,28 @@ def print_table(rows: List[List[str]]) -> None:
             print(str(row[i]).ljust(col_widths[i]), end=" | ")
         print("")
     print("-" * total_width)
+
+
+def with_retries(
+        func: Callable[[], T],
+        tries: int,
+        backoff_secs: float,
+        retry_on: Tuple[Type[BaseException], ...],
+        on_retry: Optional[Callable[[BaseException, float], None]] = None,
+) -> T:
+    """
+    Calls the function until it succeeds or runs out of tries, waiting an exponentially growing (and jittered) amount
+    of time between attempts. Only the exceptions in `retry_on` are retried, anything else is raised right away.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except retry_on as e:
+            attempt += 1
+            if attempt >= tries:
+                raise
+            wait_secs = backoff_secs * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            if on_retry:
+                on_retry(e, wait_secs)
+            time.sleep(wait_secs)